@@ -15,6 +15,10 @@ def create_app():
     from . import api
     api.init_app(app)
 
+    from . import commands
+    commands.init_app(app)
+    commands.log_missing_indexes()
+
     @app.before_request
     def before_app_request():
         url_obj = tld.extract(request.headers.get('Host', ''))
@@ -1,12 +1,15 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask_login import current_user
 from flask import Blueprint, request, jsonify, current_app
 
-from app.models.user import User
 from app.models.followup import FollowUp
-from app.models.event import Event, RecurringExceptionEvent as REE
+from app.models.event import Event, EventSummary
+from app.models.directory import UserDirectory
+from app.models.search import EventSearch
+from app.utils.datetime import get_datetime
+from app.models.availability import BusyIntervals
 
 logger = logging.getLogger(__name__)
 api = Blueprint('events', __name__, url_prefix='/api/v1/events')
@@ -41,11 +44,8 @@ def create_event():
     event = Event(**req_json)
     calendar.add_event(event, follow_up=followup, video_conf_type=conf_type)
     rv = event.to_full_object(current_user.id, current_user.timeZone)
-    user_id = current_user.id
-
-    @current_app.after_response
-    def post_process():
-        User.find_one({"id": user_id}).sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=current_user.id,
+                                       key=f"sync_calendars:{current_user.id}:request")
     return jsonify(rv), 201
 
 
@@ -101,11 +101,8 @@ def edit_event(event_id):
     calendar = account.get_calendar()
     calendar.edit_event(event, edit_type=edit_type, instance_id=instance_id, keys=req_json.keys())
     rv = event.to_full_object(current_user.id, current_user.timeZone)
-    user_id = current_user.id
-
-    @current_app.after_response
-    def post_process():
-        User.find_one({"id": user_id}).sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=current_user.id,
+                                       key=f"sync_calendars:{current_user.id}:request")
     return jsonify(rv), 200
 
 
@@ -122,11 +119,8 @@ def rsvp_to_event(event_id):
     calendar = account.get_calendar()
     calendar.rsvp_to_event(event, req_json["responseStatus"])
     rv = event.json()
-    user_id = current_user.id
-
-    @current_app.after_response
-    def post_process():
-        User.find_one({"id": user_id}).sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=current_user.id,
+                                       key=f"sync_calendars:{current_user.id}:request")
     return jsonify(rv), 200
 
 
@@ -150,11 +144,8 @@ def delete_event(event_id):
 
     calendar = account.get_calendar()
     calendar.delete_event(event, delete_type=delete_type, instance_id=instance_id)
-    user_id = current_user.id
-
-    @current_app.after_response
-    def post_process():
-        User.find_one({"id": user_id}).sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=current_user.id,
+                                       key=f"sync_calendars:{current_user.id}:request")
     return {}, 200
 
 
@@ -177,25 +168,77 @@ def delete_event(event_id):
 #     return {"message": "success"}, 200
 
 
+def get_slot(start, end):
+    """The `(start, end)` datetimes of a slot, `None` unless both are dates and `start` is before `end`."""
+    if not (isinstance(start, str) and isinstance(end, str)):
+        return None
+    try:
+        start, end = get_datetime(start), get_datetime(end)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return (start, end) if start < end else None
+
+
+def check_conflict_span(slots):
+    """Error response when the slots span more than `CONFLICT_MAX_DAYS`, the window expanded for them."""
+    max_days = current_app.config.get('CONFLICT_MAX_DAYS')
+    if max(end for _, end in slots) - min(start for start, _ in slots) > timedelta(days=max_days):
+        return {"message": f"Slots should span {max_days} days at most."}, 400
+
+
 def conflicts():
-    start = request.args.get("start")
-    end = request.args.get("end")
-    result = Event.fetch_by_date_range(start, end, current_user.id)
-    return {"count": len(result)}, 200
+    slot = get_slot(request.args.get("start"), request.args.get("end"))
+    if not slot:
+        return {"message": "`start` and `end` are mandatory dates, `start` before `end`."}, 400
+    error = check_conflict_span([slot])
+    if error:
+        return error
+    count, = BusyIntervals.count_conflicts(current_user.id, [slot])
+    return {"count": count}, 200
+
+
+def batch_conflicts():
+    """Conflicts of many candidate slots at once, `{"slots": [{"start", "end"}, ...]}` -> `{"counts": [...]}`."""
+    body = request.get_json(silent=True)
+    slots = body.get("slots") if isinstance(body, dict) else None
+    if not isinstance(slots, list):
+        return {"message": "`slots` should be a list of `{\"start\", \"end\"}`."}, 400
+    max_slots = current_app.config.get('CONFLICT_MAX_SLOTS')
+    if len(slots) > max_slots:
+        return {"message": f"At most {max_slots} slots can be checked at once."}, 400
+    slots = [get_slot(slot.get("start"), slot.get("end")) if isinstance(slot, dict) else None for slot in slots]
+    if not all(slots):
+        return {"message": "Every slot needs a `start` and an `end` date, `start` before `end`."}, 400
+    if not slots:
+        return {"counts": []}, 200
+    error = check_conflict_span(slots)
+    if error:
+        return error
+    counts = BusyIntervals.count_conflicts(current_user.id, slots)
+    return {"counts": counts}, 200
 
 
 def search():
+    """Events matching `q`, best first, `?q[&start][&end][&meetSection][&pageSize][&cursor]`.
+
+    Returns `{"results": [...], "next": cursor}`, `next` is null on the last page.
+    """
     q = request.args.get("q")
-    meetsection = request.args.get("meetSection")
     if not q:
         return {"message": "Search term `q` cannot be empty."}
-    query = {"$text": {"$search": q.strip()}, "user": current_user.id}
-    if meetsection:
-        query["meetsections"] = meetsection
-    results = [Event(**e).to_simple_object() for e in Event.find(query)] + \
-              [REE(**ree).to_simple_object() for ree in REE.find(query)]
+    try:
+        page_size = int(request.args.get("pageSize", current_app.config.get('SEARCH_PAGE_SIZE')))
+        event_search = EventSearch(current_user.id, q.strip(),
+                                   page_size=max(1, min(page_size, current_app.config.get('SEARCH_MAX_PAGE_SIZE'))),
+                                   start=request.args.get("start"), end=request.args.get("end"),
+                                   meetsection=request.args.get("meetSection"))
+        events, next_cursor = event_search.page(request.args.get("cursor"))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    UserDirectory.current().prime_events(events)
+    results = [EventSummary(e).to_simple_object() for e in events]
     status_code = 200 if results else 204
-    return jsonify(results), status_code
+    return jsonify({"results": results, "next": next_cursor}), status_code
 
 
 api.add_url_rule('/', view_func=create_event, methods=['POST'])
@@ -203,4 +246,5 @@ api.add_url_rule('/<event_id>/', view_func=get_event)
 api.add_url_rule('/<event_id>/', view_func=edit_event, methods=['PUT'])
 api.add_url_rule('/<event_id>/', view_func=delete_event, methods=['DELETE'])
 api.add_url_rule('/conflicts/', view_func=conflicts)
+api.add_url_rule('/conflicts/', view_func=batch_conflicts, methods=['POST'])
 api.add_url_rule('/search/', view_func=search)
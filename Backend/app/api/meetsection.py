@@ -1,4 +1,7 @@
 import logging
+import numpy as np
+
+from datetime import timedelta
 
 from flask_login import current_user
 from flask import Blueprint, request, jsonify, current_app
@@ -7,6 +10,8 @@ from app import app
 from app.models.user import User
 from app.utils.precheck import precheck
 from app.models.meetsection import Meetsection
+from app.models.availability import BusyBitmap
+from app.utils.datetime import get_datetime, get_timezone
 from app.extensions import mailer, firebase_service
 
 logger = logging.getLogger(__name__)
@@ -42,7 +47,7 @@ def create_meetsection():
 
     @current_app.after_response
     def notify_and_send_invite():
-        _users = User.find({"accounts.email": {"$in": members}})
+        _users = User.find({"accounts.email": {"$in": members}}, projection={"id": 1, "accounts.email": 1})
         to_addr = ', '.join(list(set(members) - set([u["accounts"][0]["email"] for u in _users])))
         if to_addr:
             send_invite(to_addr, current_user.name)
@@ -55,11 +60,12 @@ def create_meetsection():
 
 def list_meetsections():
     meetsections = Meetsection.fetch_for_user(current_user.get_primary_email())
-    current_user.sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=current_user.id,
+                                       key=f"sync_calendars:{current_user.id}:request")
     result = []
     for meetsection in meetsections:
         meetsection.pop('_id')
-        result.append(Meetsection(**meetsection).to_full_object(current_user.id))
+        result.append(Meetsection.from_db(meetsection).to_full_object(current_user.id))
     return jsonify(result), 200
 
 
@@ -104,7 +110,7 @@ def add_user_to_meetsection(meetsection_id):
 
     @current_app.after_response
     def notify_and_send_invite():
-        _users = User.find({"accounts.email": {"$in": members}})
+        _users = User.find({"accounts.email": {"$in": members}}, projection={"id": 1, "accounts.email": 1})
         to_addr = ', '.join(list(set(members) - set([u["accounts"][0]["email"] for u in _users])))
         send_invite(to_addr, current_user.name)
         firebase_service.notify_all([u["id"] for u in _users if not current_user.id == u["id"]],
@@ -135,6 +141,48 @@ def is_meetsection_name_unique():
     return {"isUnique": str(is_unique)}, 200
 
 
+def find_free_slots(meetsection_id):
+    """Common free slots of the members, `?start&end[&duration=30][&count=5][&dayStart=09:00&dayEnd=18:00]`.
+
+    Working hours are in the current user's time zone, `count` is capped at `FREE_SLOT_MAX_COUNT`.
+    """
+    query = {"id": meetsection_id, "members.email": current_user.get_primary_email()}
+    meetsection = Meetsection.find_one(query=query)
+    if not meetsection:
+        return {"message": "Meetsection not found for user"}, 404
+    try:
+        start = get_datetime(request.args["start"])
+        end = get_datetime(request.args["end"])
+        duration = timedelta(minutes=int(request.args.get("duration", 30)))
+        count = int(request.args.get("count", 5))
+        day_start = get_minutes(request.args.get("dayStart", "00:00"))
+        day_end = get_minutes(request.args.get("dayEnd", "24:00"))
+    except (KeyError, ValueError):
+        return {"message": "`start` and `end` are mandatory, `duration` and `count` are numbers and "
+                           "`dayStart` and `dayEnd` are HH:MM."}, 400
+    if not start < end <= start + timedelta(days=app.config.get('FREE_SLOT_MAX_DAYS')):
+        return {"message": f"End should be later than start, by {app.config.get('FREE_SLOT_MAX_DAYS')} days "
+                           f"at most."}, 400
+    if count < 1:
+        return {"message": "`count` should be at least 1."}, 400
+    count = min(count, app.config.get('FREE_SLOT_MAX_COUNT'))
+
+    users = [user["id"] for user in meetsection.get_users()]
+    granularity = timedelta(minutes=app.config.get('FREE_SLOT_GRANULARITY_MINUTES'))
+    bitmap = BusyBitmap.for_users(users, start, end, granularity)
+    working_hours = None
+    if (day_start, day_end) != (0, 24 * 60):
+        working_hours = bitmap.get_working_hours(get_timezone(current_user.timeZone or 'UTC'), day_start, day_end)
+    slots = bitmap.find_free_slots(duration, count, allowed=working_hours)
+    return jsonify([{"start": np.datetime_as_string(s, unit='s') + 'Z',
+                     "end": np.datetime_as_string(e, unit='s') + 'Z'} for s, e in slots]), 200
+
+
+def get_minutes(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
 api.add_url_rule('/', view_func=list_meetsections)
 api.add_url_rule('/<meetsection_id>/', view_func=get_meetsection)
 api.add_url_rule('/', methods=['POST'], view_func=create_meetsection)
@@ -142,3 +190,4 @@ api.add_url_rule('/<meetsection_id>/', methods=['PUT'], view_func=edit_meetsecti
 api.add_url_rule('/<meetsection_id>/users/', methods=['POST'], view_func=add_user_to_meetsection)
 api.add_url_rule('/<meetsection_id>/users/', methods=['DELETE'], view_func=remove_user_from_meetsection)
 api.add_url_rule('/is_unique/', view_func=is_meetsection_name_unique)
+api.add_url_rule('/<meetsection_id>/free_slots/', view_func=find_free_slots)
@@ -90,10 +90,9 @@ def signin_with_google_callback():
     session['oauth_token'] = token
     redirect_url = app.config.get('APP_URL') + path
 
-    @current_app.after_response
-    def post_process():
-        if not initial:
-            user.sync_calendars()
+    if not initial:
+        current_app.after_response.enqueue("sync_calendars", user_id=user.id,
+                                           key=f"sync_calendars:{user.id}:request")
 
     return redirect(redirect_url)
 
@@ -145,10 +144,9 @@ def signin_with_microsoft_callback():
     session['oauth_token'] = token
     redirect_url = app.config.get('APP_URL') + path
 
-    @current_app.after_response
-    def post_process():
-        if not initial:
-            user.sync_calendars()
+    if not initial:
+        current_app.after_response.enqueue("sync_calendars", user_id=user.id,
+                                           key=f"sync_calendars:{user.id}:request")
 
     return redirect(redirect_url)
 
@@ -49,9 +49,8 @@ def get_user_context():
             m["type"] = "shared"
         to_ret["meetSections"].append(m)
 
-    @current_app.after_response
-    def post_process():
-        user.sync_calendars()
+    current_app.after_response.enqueue("sync_calendars", user_id=user.id,
+                                       key=f"sync_calendars:{user.id}:request")
     return to_ret, 200
 
 
@@ -0,0 +1,204 @@
+import sys
+import logging
+
+from datetime import datetime, timedelta
+
+import click
+
+from pymongo import TEXT
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def get_models():
+    """The models, and the job queue, with the indexes they declare."""
+    from app.extensions import job_queue
+    from app.models.user import User
+    from app.models.calendar import Calendar
+    from app.models.followup import FollowUp
+    from app.models.meetspace import Meetspace
+    from app.models.sync_state import SyncState
+    from app.models.meetsection import Meetsection
+    from app.models.occurrence import EventOccurrence
+    from app.models.event import Event, RecurringExceptionEvent
+    return [User, Calendar, Event, RecurringExceptionEvent, EventOccurrence,
+            Meetsection, Meetspace, FollowUp, SyncState, job_queue]
+
+
+def get_query_shapes():
+    """`(model, query, sort)` of every query the model layer runs, with placeholder values."""
+    from app.models.user import User
+    from app.models.calendar import Calendar
+    from app.models.followup import FollowUp
+    from app.models.meetspace import Meetspace
+    from app.models.sync_state import SyncState
+    from app.models.meetsection import Meetsection
+    from app.models.occurrence import EventOccurrence
+    from app.models.event import Event, RecurringExceptionEvent as REE
+    from app.extensions import job_queue
+    now = datetime.utcnow()
+    later = now + timedelta(days=30)
+    return [
+        (User, {"id": "USR"}, None),
+        (User, {"accounts.email": {"$in": ["a@b.c"]}}, None),
+        (User, {"accounts.email": "a@b.c", "accounts.type": "google"}, None),
+        (Calendar, {"user": "a@b.c", "provider": "google"}, None),
+        (Event, Event.get_query({"id": {"$in": ["EVT"]}}), None),
+        (Event, Event.get_query({"start": {"$gte": now, "$lt": later}, "isRecurring": {"$ne": True}, "user": "USR"}),
+         None),
+        (Event, Event.get_query({"user": "USR", "isRecurring": {"$ne": True}, "end": {"$gt": now},
+                                 "start": {"$lt": later}}), None),
+        (Event, Event.get_query({"user": "USR", "isRecurring": True, "start": {"$lt": later}}), None),
+        (Event, Event.get_query({"isRecurring": True, "user": "USR",
+                                 "$or": [{"recurrenceEnd": {"$exists": False}}, {"recurrenceEnd": {"$gte": now}}]}),
+         None),
+        (Event, {"providerId": {"$in": ["p"]}}, None),
+        (Event, {"user": "USR", "providerId": {"$in": ["p"]}}, None),
+        (Event, Event.get_query({"user": "USR", "isRecurring": True, "occurrencesUntil": {"$exists": False}}), None),
+        (Event, Event.get_query({"isRecurring": True, "occurrencesUntil": {"$lt": now}}), None),
+        (Event, Event.get_query(Meetsection.get_events_query(["SEC"], "USR")), None),
+        (Event, Event.get_query({"$text": {"$search": "standup"}, "user": "USR"}), None),
+        (Event, Event.get_query({"$text": {"$search": "standup"}, "user": "USR",
+                                 "start": {"$gte": now, "$lt": later}, "meetsections": "SEC"}), None),
+        (REE, REE.get_query({"$text": {"$search": "standup"}, "user": "USR"}), None),
+        (REE, {"recurringEventProviderId": {"$in": ["p"]}}, None),
+        (REE, REE.get_query({"id": {"$in": ["EVT"]}}), None),
+        (REE, {"providerId": {"$in": ["p"]}}, None),
+        (EventOccurrence, {"user": "USR", "start": {"$gte": now, "$lt": later}, "event": {"$nin": ["EVT"]}},
+         [("start", 1)]),
+        (EventOccurrence, {"event": "EVT"}, None),
+        (EventOccurrence, {"event": "EVT", "id": {"$nin": ["EVT__20200101T000000Z"]}}, None),
+        (EventOccurrence, {"id": "EVT__20200101T000000Z"}, None),
+        (Meetsection, {"id": {"$in": ["SEC"]}, "members.email": "a@b.c"}, None),
+        (Meetsection, {"members.email": "a@b.c", "createdBy": "system"}, None),
+        (Meetsection, {"name": "Team", "members.email": "a@b.c"}, None),
+        (Meetspace, {"name": "team"}, None),
+        (FollowUp, {"id": "FWP"}, None),
+        (SyncState, {"user": "USR"}, None),
+        (job_queue, {"$or": [{"status": "queued", "runAt": {"$lte": now}},
+                             {"status": "running", "leaseExpiresAt": {"$lt": now}}]}, [("runAt", 1)]),
+        (job_queue, {"key": "sync_calendars:USR", "status": "queued"}, None),
+        (job_queue, {"id": "JOB", "worker": "host"}, None),
+    ]
+
+
+def drop_replaced_indexes(collection, indexes):
+    """Drop the stored indexes the declared ones replace.
+
+    A collection holds a single text index, the stored one goes when the model declares
+    another. An index declared under the name of a stored one with another filter goes too.
+    """
+    declared = {index.document["name"]: index.document for index in indexes}
+    for name, info in collection.index_information().items():
+        if name in declared:
+            replaced = info.get("partialFilterExpression") != declared[name].get("partialFilterExpression")
+        else:
+            replaced = any(kind == TEXT for _, kind in info["key"])
+        if replaced:
+            click.echo(f"{collection.name}: dropping {name}")
+            collection.drop_index(name)
+
+
+def create_indexes():
+    """Create the indexes declared by the models.
+
+    Existing indexes are left as they are, but replaced ones.
+    """
+    failed = False
+    for model in get_models():
+        if not model._indexes:
+            continue
+        collection = db.get_conn()[model._collection]
+        try:
+            drop_replaced_indexes(collection, model._indexes)
+            names = collection.create_indexes(model._indexes)
+        except OperationFailure as e:
+            failed = True
+            logger.error(f"Could not create the indexes of `{model._collection}`: {e}")
+            continue
+        click.echo(f"{model._collection}: {', '.join(names)}")
+    return not failed
+
+
+def log_missing_indexes():
+    """Log the `_required_indexes` missing from the database, they are created by `create-indexes` only."""
+    for model in get_models():
+        if not model._required_indexes:
+            continue
+        try:
+            stored = db.get_conn()[model._collection].index_information()
+        except PyMongoError as e:
+            logger.error(f"Could not list the indexes of `{model._collection}`: {e}")
+            continue
+        missing = [index.document["name"] for index in model._required_indexes
+                   if index.document["name"] not in stored]
+        if missing:
+            logger.error(f"`{model._collection}` is missing the indexes {', '.join(missing)}, "
+                         f"run `flask create-indexes`")
+
+
+def backfill_active():
+    """Recompute the `active` flag of the stored events, and store `isRecurring` where it is missing.
+
+    Safe to run again, only out of date documents are written.
+    """
+    from app.models.event import Event, RecurringExceptionEvent
+    inactive = [{"isDeleted": True}, {"status": Event.Status.CANCELLED.value}]
+    for model in [Event, RecurringExceptionEvent]:
+        collection = model.get_collection()
+        deactivated = collection.update_many({"$or": inactive, "active": {"$ne": False}}, {"$set": {"active": False}})
+        activated = collection.update_many({"$nor": inactive, "active": {"$ne": True}}, {"$set": {"active": True}})
+        flagged = collection.update_many({"isRecurring": {"$exists": False}}, {"$set": {"isRecurring": False}})
+        click.echo(f"{model._collection}: {activated.modified_count} active, "
+                   f"{deactivated.modified_count} inactive, {flagged.modified_count} non recurring documents updated")
+
+
+def get_plan_stages(plan):
+    yield plan["stage"]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from get_plan_stages(child)
+
+
+def check_indexes():
+    """Explain every query shape, returns the ones whose winning plan scans a whole collection."""
+    collection_scans = []
+    for model, query, sort in get_query_shapes():
+        cursor = db.get_conn()[model._collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = list(get_plan_stages(plan))
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        click.echo(f"{status:8} {model._collection} {query} {' <- '.join(stages)}")
+        if "COLLSCAN" in stages:
+            collection_scans.append((model, query))
+    return collection_scans
+
+
+def init_app(app):
+    @app.cli.command("create-indexes")
+    def create_indexes_command():
+        """Create the indexes declared by the models."""
+        if not create_indexes():
+            sys.exit(1)
+
+    @app.cli.command("backfill-active")
+    def backfill_active_command():
+        """Set the `active` and `isRecurring` flags of the events written before they were stored."""
+        backfill_active()
+
+    @app.cli.command("remove-duplicate-occurrences")
+    def remove_duplicate_occurrences_command():
+        """Delete the occurrences stored twice, the unique index on their id cannot be built over them."""
+        from app.models.occurrence import EventOccurrence
+        click.echo(f"{EventOccurrence._collection}: {EventOccurrence.remove_duplicates()} duplicates removed")
+
+    @app.cli.command("check-indexes")
+    def check_indexes_command():
+        """Fail when a query of the model layer is not served by an index."""
+        if check_indexes():
+            sys.exit(1)
@@ -6,6 +6,8 @@ from .db import MongoDB
 from .logging import Logger
 from .mailing import MailingService
 from .firebase import FirebaseService
+from .job_queue import JobQueue
+from .range_cache import RangeCache
 from .after_response import AfterResponse
 
 db = MongoDB()
@@ -15,7 +17,9 @@ paranoid = Paranoid()
 login_manager = LoginManager()
 mailer = MailingService()
 firebase_service = FirebaseService()
-after_response = AfterResponse()
+job_queue = JobQueue(db)
+after_response = AfterResponse(job_queue)
+range_cache = RangeCache()
 
 
 def init_app(app):
@@ -25,5 +29,7 @@ def init_app(app):
                       login_manager,
                       mailer,
                       firebase_service,
-                      after_response):
+                      job_queue,
+                      after_response,
+                      range_cache):
         extension.init_app(app)
@@ -7,8 +7,10 @@ logger = logging.getLogger(__name__)
 
 
 class AfterResponse:
-    def __init__(self, app=None):
+    def __init__(self, job_queue=None, app=None):
+        self.job_queue = job_queue
         self.callbacks = []
+        self.jobs = []
         if app:
             self.init_app(app)
 
@@ -16,6 +18,10 @@ class AfterResponse:
         self.callbacks.append(callback)
         return callback
 
+    def enqueue(self, task, run_at=None, key=None, **kwargs):
+        """Queue a job for the background worker once the response is closed."""
+        self.jobs.append(self.job_queue.build_job(task, kwargs, run_at=run_at, key=key))
+
     def init_app(self, app):
         # install extension
         app.after_response = self
@@ -24,6 +30,13 @@ class AfterResponse:
         app.wsgi_app = AfterResponseMiddleware(app.wsgi_app, self)
 
     def flush(self):
+        jobs, self.jobs = self.jobs, []
+        try:
+            self.job_queue.enqueue_many(jobs)
+        except Exception:
+            logger.error("\n\n--- Traceback Begins ".ljust(184, '-') + "\n\n" +
+                         traceback.format_exc() +
+                         "\n--- Traceback Ends ".ljust(184, '-') + "\n\n")
         while self.callbacks:
             try:
                 self.callbacks.pop()()
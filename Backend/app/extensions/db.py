@@ -1,13 +1,13 @@
 from flask_pymongo import PyMongo
-from pymongo import TEXT
-from pymongo.errors import CollectionInvalid, OperationFailure
+from pymongo.errors import CollectionInvalid
 
 
 class MongoDB:
     mongo = None
     uri = None
     database = None
-    COLLECTIONS = ['users', 'events', 'recurring_exception_events', 'calendars', 'meetsections']
+    COLLECTIONS = ['users', 'events', 'recurring_exception_events', 'calendars', 'meetsections',
+                   'jobs', 'sync_states', 'event_occurrences']
 
     def __init__(self, app=None):
         self.app = app
@@ -26,23 +26,6 @@ class MongoDB:
             except CollectionInvalid:
                 pass
 
-        # Create Index
-        ev_index_weights = {'title': 2, 'description': 1}
-        ev_index_keys = [('title', TEXT), ('description', TEXT)]
-        try:
-            events = self.mongo.cx[self.database]["events"]
-            events.create_index(ev_index_keys, weights=ev_index_weights,
-                                default_language="english")
-        except OperationFailure:
-            pass
-
-        try:
-            exceptions = self.mongo.cx[self.database]["recurring_exception_events"]
-            exceptions.create_index(ev_index_keys, weights=ev_index_weights,
-                                    default_language="english")
-        except OperationFailure:
-            pass
-
     def get_conn(self):
         try:
             return self.mongo.cx[self.database]
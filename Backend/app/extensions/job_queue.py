@@ -0,0 +1,197 @@
+import time
+import socket
+import logging
+import traceback
+
+from datetime import datetime, timedelta
+
+import shortuuid
+
+from pymongo import IndexModel, ASCENDING, ReturnDocument
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobLeaseLost(Exception):
+    """The lease of a running job expired and another worker claimed it, the handler must stop."""
+
+
+class JobQueue:
+    """Mongo backed job queue.
+
+    Jobs are documents in the `jobs` collection. A worker claims a job by taking a
+    lease on it; a job whose lease expires (worker crashed) becomes claimable again.
+    Long running handlers keep their lease with the `heartbeat` they are handed.
+    Failed jobs are retried with exponential backoff until `maxAttempts` is reached.
+    """
+    _collection = 'jobs'
+    _indexes = []
+    _required_indexes = []
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.tasks = dict()
+        self.heartbeat_tasks = set()
+        self.lease_seconds = 300
+        self.max_attempts = 5
+        self.backoff_base = 10
+        self.backoff_max = 3600
+        self.poll_interval = 2
+        self.retention = 7 * 24 * 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.lease_seconds = app.config.get('JOB_LEASE_SECONDS', self.lease_seconds)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', self.max_attempts)
+        self.backoff_base = app.config.get('JOB_BACKOFF_BASE', self.backoff_base)
+        self.backoff_max = app.config.get('JOB_BACKOFF_MAX', self.backoff_max)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.retention = app.config.get('JOB_RETENTION', self.retention)
+        app.job_queue = self
+        self._indexes = [IndexModel([("id", ASCENDING)]),
+                         IndexModel([("status", ASCENDING), ("runAt", ASCENDING)]),
+                         IndexModel([("status", ASCENDING), ("leaseExpiresAt", ASCENDING)]),
+                         IndexModel([("key", ASCENDING), ("status", ASCENDING)], sparse=True),
+                         IndexModel([("finishedAt", ASCENDING)], expireAfterSeconds=self.retention)]
+
+    def get_collection(self):
+        return self.db.get_conn()[self._collection]
+
+    def task(self, name, heartbeat=False):
+        """Register a task handler.
+
+        With `heartbeat`, the handler is called with a `heartbeat` callable renewing the
+        job's lease, to call more often than every `lease_seconds` while it runs.
+        """
+        def wrap(f):
+            self.tasks[name] = f
+            if heartbeat:
+                self.heartbeat_tasks.add(name)
+            return f
+        return wrap
+
+    # Producer
+
+    def build_job(self, task, kwargs=None, run_at=None, max_attempts=None, key=None):
+        utc_now = datetime.utcnow()
+        job = {
+            "id": "JOB" + shortuuid.uuid()[:15],
+            "task": task,
+            "kwargs": kwargs or dict(),
+            "status": self.QUEUED,
+            "attempts": 0,
+            "maxAttempts": max_attempts or self.max_attempts,
+            "runAt": run_at or utc_now,
+            "createdAt": utc_now,
+            "updatedAt": utc_now
+        }
+        if key:
+            job["key"] = key
+        return job
+
+    def enqueue(self, task, run_at=None, max_attempts=None, key=None, **kwargs):
+        """Queue a job. With a `key`, the job is coalesced into an already queued job with the same key."""
+        job = self.build_job(task, kwargs, run_at=run_at, max_attempts=max_attempts, key=key)
+        self.enqueue_many([job])
+        return job["id"]
+
+    def enqueue_many(self, jobs):
+        collection = self.get_collection()
+        unique_jobs = [job for job in jobs if "key" not in job]
+        if unique_jobs:
+            collection.insert_many(unique_jobs, ordered=False)
+        keyed_jobs = {job["key"]: job for job in jobs if "key" in job}
+        for key, job in keyed_jobs.items():
+            job = {k: v for k, v in job.items() if k not in ("key", "status")}
+            collection.update_one({"key": key, "status": self.QUEUED},
+                                  {"$setOnInsert": job}, upsert=True)
+
+    # Consumer
+
+    def claim(self, worker_id):
+        utc_now = datetime.utcnow()
+        query = {"$or": [{"status": self.QUEUED, "runAt": {"$lte": utc_now}},
+                         {"status": self.RUNNING, "leaseExpiresAt": {"$lt": utc_now}}]}
+        update = {"$set": {"status": self.RUNNING,
+                           "worker": worker_id,
+                           "leaseExpiresAt": utc_now + timedelta(seconds=self.lease_seconds),
+                           "updatedAt": utc_now},
+                  "$inc": {"attempts": 1}}
+        return self.get_collection().find_one_and_update(query, update, sort=[("runAt", ASCENDING)],
+                                                         return_document=ReturnDocument.AFTER)
+
+    def renew(self, job):
+        """Extend the lease of a running job, `False` when another worker claimed it in the meantime."""
+        utc_now = datetime.utcnow()
+        update = {"$set": {"leaseExpiresAt": utc_now + timedelta(seconds=self.lease_seconds), "updatedAt": utc_now}}
+        result = self.get_collection().update_one({"id": job["id"], "worker": job["worker"],
+                                                   "status": self.RUNNING}, update)
+        return bool(result.matched_count)
+
+    def keep(self, job):
+        """Renew the lease of a running job, raises `JobLeaseLost` when it cannot be."""
+        if not self.renew(job):
+            raise JobLeaseLost(f"Job {job['id']} ({job['task']}) was claimed by another worker.")
+
+    def complete(self, job):
+        utc_now = datetime.utcnow()
+        self.get_collection().update_one({"id": job["id"], "worker": job["worker"]},
+                                         {"$set": {"status": self.DONE, "finishedAt": utc_now,
+                                                   "updatedAt": utc_now},
+                                          "$unset": {"leaseExpiresAt": ""}})
+
+    def fail(self, job, error):
+        utc_now = datetime.utcnow()
+        update = {"status": self.QUEUED, "lastError": error, "updatedAt": utc_now}
+        if job["attempts"] >= job["maxAttempts"]:
+            update["status"] = self.FAILED
+            update["finishedAt"] = utc_now
+        else:
+            backoff = min(self.backoff_base * (2 ** (job["attempts"] - 1)), self.backoff_max)
+            update["runAt"] = utc_now + timedelta(seconds=backoff)
+        self.get_collection().update_one({"id": job["id"], "worker": job["worker"]},
+                                         {"$set": update, "$unset": {"leaseExpiresAt": ""}})
+
+    def run_job(self, job):
+        handler = self.tasks.get(job["task"])
+        if handler is None:
+            job["attempts"] = job["maxAttempts"]
+            self.fail(job, f"No handler registered for task `{job['task']}`")
+            return
+        if job["attempts"] > job["maxAttempts"]:
+            # Lease expired on the last allowed attempt, the worker running it died.
+            self.fail(job, job.get("lastError") or "Lease expired on final attempt")
+            return
+        kwargs = dict(job["kwargs"])
+        if job["task"] in self.heartbeat_tasks:
+            kwargs["heartbeat"] = lambda: self.keep(job)
+        try:
+            handler(**kwargs)
+        except JobLeaseLost as e:
+            # The worker now holding the lease completes or fails the job
+            logger.warning(str(e))
+        except Exception:
+            error = traceback.format_exc()
+            logger.error(f"Job {job['id']} ({job['task']}) failed on attempt {job['attempts']}.\n{error}")
+            self.fail(job, error)
+        else:
+            self.complete(job)
+
+    def work(self, burst=False):
+        worker_id = f"{socket.gethostname()}:{shortuuid.uuid()[:8]}"
+        logger.warning(f"Job worker {worker_id} started.")
+        while True:
+            job = self.claim(worker_id)
+            if not job:
+                if burst:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self.run_job(job)
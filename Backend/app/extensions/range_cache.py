@@ -0,0 +1,40 @@
+import threading
+
+from cachetools import LRUCache
+
+
+class RangeCache:
+    """In process LRU cache of calendar range results.
+
+    Entries are keyed by `(user, start, end, calendar, version)`, `version` being the
+    user's calendar version, which every write to their events bumps. Ranges cached
+    before a write are never looked up again and age out of the LRU. Cached results
+    are shared between requests, callers must not modify them.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LRUCache(maxsize=256)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = LRUCache(maxsize=app.config.get('RANGE_CACHE_SIZE'))
+
+    def get(self, key, compute):
+        """The cached result under `key`, `compute()` stored under it on a miss."""
+        with self.lock:
+            result = self.cache.get(key)
+        if result is not None:
+            self.stats["hits"] += 1
+            return result
+        self.stats["misses"] += 1
+        result = compute()
+        with self.lock:
+            self.cache[key] = result
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
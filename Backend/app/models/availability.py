@@ -0,0 +1,187 @@
+import numpy as np
+
+from app.utils.datetime import get_datetime, get_datetime64, get_start_times_array, get_utc_offsets
+from app.models.event import Event, RecurringExceptionEvent
+
+
+class BusyIntervals:
+    """The intervals a user is busy in a window, as `datetime64[us]` arrays of naive UTC instants.
+
+    Built from the stored fields only, no event is hydrated or serialized: plain events
+    come from an interval query on (user, isRecurring, end, start), `isRecurring` missing on
+    the events stored before it was written when False, and the occurrences
+    of recurring events are computed from their master's rules, with the exceptions of
+    the series applied. Intervals are sorted by start.
+    """
+    projection = {"_id": 0, "user": 1, "start": 1, "end": 1}
+    master_projection = {"_id": 0, "user": 1, "providerId": 1, "start": 1, "end": 1, "recurrence": 1,
+                         "recurrenceEnd": 1}
+    exception_projection = {"_id": 0, "recurringEventProviderId": 1, "originalStart": 1, "start": 1, "end": 1,
+                            "active": 1, "isDeleted": 1, "status": 1}
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+        self._sorted_ends = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def for_user(cls, user, start, end):
+        return cls.for_users([user], start, end)[user]
+
+    @classmethod
+    def for_users(cls, users, start, end):
+        """Busy intervals of each user, `{user: BusyIntervals}`, loaded with the same three queries as for one."""
+        start = get_datetime(start)
+        end = get_datetime(end)
+        users = list(set(users))
+        documents = {user: [] for user in users}
+        for document in Event.stream({"user": {"$in": users}, "isRecurring": {"$ne": True}, "end": {"$gt": start},
+                                      "start": {"$lt": end}}, projection=cls.projection):
+            documents[document["user"]].append(document)
+        intervals = {user: [cls.get_intervals(_documents)] for user, _documents in documents.items()}
+        for user, _intervals in cls.get_recurring_intervals(users, start, end):
+            intervals[user].append(_intervals)
+        return {user: cls.from_intervals(_intervals, start, end) for user, _intervals in intervals.items()}
+
+    @classmethod
+    def from_intervals(cls, intervals, start, end):
+        starts = np.concatenate([s for s, _ in intervals])
+        ends = np.concatenate([e for _, e in intervals])
+        window_start, window_end = get_datetime64(start), get_datetime64(end)
+        overlapping = (starts < window_end) & (ends > window_start)
+        starts, ends = starts[overlapping], ends[overlapping]
+        order = np.argsort(starts, kind='stable')
+        return cls(starts[order], ends[order])
+
+    @staticmethod
+    def get_intervals(documents):
+        starts, ends = [], []
+        for document in documents:
+            if document.get("start") and document.get("end"):
+                starts.append(document["start"])
+                ends.append(document["end"])
+        return np.array(starts, dtype='datetime64[us]'), np.array(ends, dtype='datetime64[us]')
+
+    @classmethod
+    def get_recurring_intervals(cls, users, start, end):
+        """`(user, intervals)` of the occurrences of the users' series, moved and cancelled ones accounted for."""
+        window_start = get_datetime64(start)
+        masters = []
+        for master in Event.stream({"user": {"$in": users}, "isRecurring": True, "start": {"$lt": end}},
+                                   projection=cls.master_projection):
+            if not (master.get("providerId") and master.get("recurrence") and master.get("end")):
+                continue
+            duration = master["end"] - master["start"]
+            recurrence_end = master.get("recurrenceEnd")
+            if recurrence_end and get_datetime64(recurrence_end + duration) <= window_start:
+                continue
+            masters.append((master, duration))
+
+        exceptions = RecurringExceptionEvent.find_for_masters([m["providerId"] for m, _ in masters],
+                                                             projection=cls.exception_projection)
+        for master, duration in masters:
+            start_times = get_start_times_array(master["recurrence"], master["start"], end,
+                                                window_start=get_datetime(start) - duration)
+            _exceptions = exceptions[master["providerId"]]
+            # Exceptions replace the occurrence starting at their original start, when they are not cancelled
+            replaced = np.array([e["originalStart"] for e in _exceptions if e.get("originalStart")],
+                                dtype='datetime64[s]')
+            if len(replaced):
+                start_times = start_times[~np.isin(start_times.astype('datetime64[s]'), replaced)]
+            yield master["user"], (start_times, start_times + np.timedelta64(duration, 'us'))
+            yield master["user"], cls.get_intervals(e for e in _exceptions if Event.is_active_document(e))
+
+    def count(self, slot_starts, slot_ends):
+        """Number of intervals overlapping each slot, for `datetime64[us]` arrays of slot bounds."""
+        if self._sorted_ends is None:
+            self._sorted_ends = np.sort(self.ends)
+        # Every interval starting before the end of a slot overlaps it, unless it ended before the slot started
+        started = np.searchsorted(self.starts, slot_ends, side='left')
+        ended = np.searchsorted(self._sorted_ends, slot_starts, side='right')
+        # Empty or reversed slots would count negative
+        return np.maximum(started - ended, 0)
+
+    @classmethod
+    def count_conflicts(cls, user, slots):
+        """Number of the user's events overlapping each `(start, end)` slot, with a single scan of the events."""
+        if not slots:
+            return []
+        slot_starts = np.array([get_datetime64(start) for start, _ in slots])
+        slot_ends = np.array([get_datetime64(end) for _, end in slots])
+        busy = cls.for_user(user, slot_starts.min().item(), slot_ends.max().item())
+        return busy.count(slot_starts, slot_ends).tolist()
+
+
+class BusyBitmap:
+    """Busy cells of a group of users over a window cut in cells of a fixed granularity.
+
+    One boolean row per user, a cell is busy when any interval of the user overlaps it.
+    Cells are aligned on the granularity, the first one starts at or after the window start.
+    """
+
+    def __init__(self, users, start, end, granularity):
+        self.users = list(users)
+        self.granularity = np.timedelta64(granularity, 'us').astype(np.int64)
+        first = -(-get_datetime64(start).astype(np.int64) // self.granularity)
+        last = get_datetime64(end).astype(np.int64) // self.granularity
+        self.origin = first * self.granularity
+        self.size = int(max(0, last - first))
+        self.rows = np.zeros((len(self.users), self.size), dtype=bool)
+
+    @classmethod
+    def for_users(cls, users, start, end, granularity):
+        bitmap = cls(users, start, end, granularity)
+        busy = BusyIntervals.for_users(bitmap.users, start, end)
+        for row, user in enumerate(bitmap.users):
+            bitmap.fill(row, busy[user])
+        return bitmap
+
+    def fill(self, row, busy):
+        first = (busy.starts.astype(np.int64) - self.origin) // self.granularity
+        last = -((self.origin - busy.ends.astype(np.int64)) // self.granularity)
+        first, last = np.clip(first, 0, self.size), np.clip(last, 0, self.size)
+        overlapping = last > first
+        # +1 where a busy run starts and -1 past its end, a cell is busy when the running sum is positive
+        changes = np.zeros(self.size + 1, dtype=np.int32)
+        np.add.at(changes, first[overlapping], 1)
+        np.add.at(changes, last[overlapping], -1)
+        self.rows[row] = np.cumsum(changes[:-1]) > 0
+
+    def get_cell_starts(self):
+        return (self.origin + np.arange(self.size, dtype=np.int64) * self.granularity).astype('datetime64[us]')
+
+    def get_working_hours(self, timezone, day_start, day_end):
+        """Mask of the cells lying between `day_start` and `day_end`, minutes of the day in `timezone`."""
+        cell_starts = self.get_cell_starts()
+        local = cell_starts + get_utc_offsets(cell_starts, timezone)
+        minutes = (local - local.astype('datetime64[D]')).astype('timedelta64[m]').astype(np.int64)
+        return (minutes >= day_start) & (minutes + self.granularity // 60000000 <= day_end)
+
+    def find_free_slots(self, duration, count, allowed=None):
+        """The first `count` slots of `duration` during which every user is free, without overlapping each other.
+
+        Returns `(start, end)` pairs of `datetime64[us]`. `allowed` masks out cells, e.g. outside working hours.
+        """
+        length = int(-(-np.timedelta64(duration, 'us').astype(np.int64) // self.granularity))
+        free = ~self.rows.any(axis=0)
+        if allowed is not None:
+            free &= allowed
+        if length < 1 or length > self.size:
+            return []
+        # Busy cells before each cell, a window is free when the count does not change over it
+        busy_before = np.concatenate(([0], np.cumsum(~free)))
+        candidates = np.flatnonzero(busy_before[length:] == busy_before[:-length])
+        slots = []
+        next_start = 0
+        for cell in candidates.tolist():
+            if cell < next_start:
+                continue
+            start = np.datetime64(int(self.origin + cell * self.granularity), 'us')
+            slots.append((start, start + np.timedelta64(length * self.granularity, 'us')))
+            if len(slots) == count:
+                break
+            next_start = cell + length
+        return slots
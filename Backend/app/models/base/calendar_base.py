@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from pymongo import IndexModel, ASCENDING
+
 from app.models.base.entity import Entity
 
 
@@ -7,12 +9,16 @@ class CalendarBase(Entity):
     _collection = 'calendars'
     _resource_prefix = 'CAL'
     _required_fields = ["provider"]
+    _indexes = Entity._indexes + [
+        IndexModel([("user", ASCENDING), ("provider", ASCENDING)])
+    ]
 
     def __init__(self,
                  user: str = None,
                  provider: str = None,
                  providerId: str = None,
                  syncToken: str = None,
+                 syncCheckpoint: dict = None,
                  notifChannel: dict = None,
                  lastSyncedAt: datetime = None,
                  *args, **kwargs):
@@ -23,6 +29,7 @@ class CalendarBase(Entity):
         self.provider = provider
         self.providerId = providerId
         self.syncToken = syncToken
+        self.syncCheckpoint = syncCheckpoint or dict()
         self.notifChannel = notifChannel or dict()
         self.lastSyncedAt = lastSyncedAt
 
@@ -66,6 +73,14 @@ class CalendarBase(Entity):
     def syncToken(self, value):
         self._sync_token = value
 
+    @property
+    def syncCheckpoint(self):
+        return self._sync_checkpoint
+
+    @syncCheckpoint.setter
+    def syncCheckpoint(self, value):
+        self._sync_checkpoint = value
+
     @property
     def lastSyncedAt(self):
         return self._last_synced_at
@@ -1,13 +1,23 @@
 import inspect
 import shortuuid
 from datetime import datetime
+from itertools import islice
 
+from pymongo import IndexModel, ASCENDING
+
+from app.utils import validation
 from app.extensions import db
 
+# Documents fetched per round trip when streaming a cursor
+STREAM_BATCH_SIZE = 500
+
 
 class EntityBase:
     _collection = None
     _required_fields = []
+    _indexes = []
+    # Indexes the code is not correct without, app start logs the missing ones
+    _required_indexes = []
 
     def validate(self):
         for f in self._required_fields:
@@ -15,13 +25,46 @@ class EntityBase:
                 formatted_field_name = ''.join(map(lambda x: x if x.islower() else " " + x, f)).title()
                 raise KeyError(f"{formatted_field_name} is mandatory.")
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._json_fields = cls.get_json_fields()
+        cls._json_field_set = frozenset(cls._json_fields)
+
+    @classmethod
+    def get_json_fields(cls):
+        """Public properties and class attributes serialized by `json`, in name order."""
+        return tuple(name for name in dir(cls)
+                     if (not name.startswith('_')) and name[0].islower() and not inspect.isroutine(getattr(cls, name)))
+
+    @classmethod
+    def from_db(cls, document):
+        """Build an object from a stored document, without validating its values again."""
+        with validation.trusted():
+            return cls(**document)
+
     def json(self):
-        attributes = inspect.getmembers(self, lambda a: not (inspect.isroutine(a)))
-        return dict([(a, v) for a, v in attributes if (not a.startswith('_')) and a[0].islower() and v])
+        result = dict()
+        for name in self._json_fields:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            if value and not inspect.isroutine(value):
+                result[name] = value
+        # Public attributes set on the instance only, e.g. `conferenceData`
+        extra = [(a, v) for a, v in self.__dict__.items()
+                 if a[0].islower() and a not in self._json_field_set and v and not inspect.isroutine(v)]
+        if extra:
+            result.update(extra)
+            result = dict(sorted(result.items()))
+        return result
 
 
 class Entity(EntityBase):
     _resource_prefix = ''
+    _indexes = [IndexModel([("id", ASCENDING)])]
+    # Documents store an `active` flag, `find`, `find_one` and `stream` skip the inactive ones unless asked
+    _active_flag = False
 
     def __init__(self,
                  id: str = None,
@@ -50,6 +93,10 @@ class Entity(EntityBase):
         collection.update_one({"id": self.id}, {"$set": self.json()},
                               upsert=True, session=session)
 
+    @classmethod
+    def get_collection(cls):
+        return db.get_conn()[cls._collection]
+
     @classmethod
     def bulk_write(cls, operations):
         result = None
@@ -61,21 +108,51 @@ class Entity(EntityBase):
         return result
 
     @classmethod
-    def find_one(cls, query=None, session=None, deleted=False):
-        if not deleted:
-            query["deletedAt"] = {"$exists": False}
-        document = db.get_conn()[cls._collection].find_one(query, session=session)
+    def get_query(cls, query=None, inactive=False):
+        """The query restricted to active documents, for the models having the `active` flag.
+
+        Documents without the flag, stored before `backfill-active` ran, are matched too.
+        The caller's query is copied, never modified.
+        """
+        query = query or dict()
+        if cls._active_flag and not inactive:
+            return {**query, "active": {"$ne": False}}
+        return query
+
+    @classmethod
+    def find_one(cls, query=None, session=None, inactive=False, projection=None):
+        document = db.get_conn()[cls._collection].find_one(cls.get_query(query, inactive), projection,
+                                                           session=session)
         if not document:
             return
-        return cls(**document)
+        return cls.from_db(document)
 
     @classmethod
-    def find(cls, query=None, session=None):
-        documents = db.get_conn()[cls._collection].find(query, session=session)
+    def find(cls, query=None, session=None, projection=None, inactive=False):
+        documents = db.get_conn()[cls._collection].find(cls.get_query(query, inactive), projection, session=session)
         if not documents:
             return []
         return list(documents)
 
+    @classmethod
+    def stream(cls, query=None, projection=None, sort=None, limit=0, skip=0, batch_size=None, session=None,
+               inactive=False):
+        """Iterate over the matching documents from a cursor, without loading them all at once."""
+        return db.get_conn()[cls._collection].find(cls.get_query(query, inactive), projection, sort=sort,
+                                                   limit=limit, skip=skip,
+                                                   batch_size=batch_size or STREAM_BATCH_SIZE, session=session)
+
+    @classmethod
+    def stream_batches(cls, query=None, batch_size=None, **kwargs):
+        """Like `stream`, yielding lists of up to `batch_size` documents."""
+        batch_size = batch_size or STREAM_BATCH_SIZE
+        documents = cls.stream(query, batch_size=batch_size, **kwargs)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return
+            yield batch
+
     @property
     def id(self):
         return self._id
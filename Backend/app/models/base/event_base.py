@@ -2,15 +2,32 @@ import datetime
 
 from enum import Enum
 
+from pymongo import IndexModel, ASCENDING, TEXT
+
 from app.utils import datetime as dt_util
 from app.models.base.entity import Entity
-from app.utils.datetime import get_start_times
+from app.utils.datetime import get_recurrence_end
 
 
 class EventBase(Entity):
     _collection = 'events'
     _resource_prefix = 'EVT'
     _required_fields = []
+    _active_flag = True
+    # Not partial on `active`, the queries also match the documents stored before the flag
+    _text_index = IndexModel([("user", ASCENDING), ("title", TEXT), ("description", TEXT), ("start", ASCENDING)],
+                             weights={"title": 2, "description": 1}, default_language="english", name="search")
+    _indexes = Entity._indexes + [
+        IndexModel([("user", ASCENDING), ("start", ASCENDING)]),
+        IndexModel([("user", ASCENDING), ("isRecurring", ASCENDING), ("end", ASCENDING), ("start", ASCENDING)]),
+        IndexModel([("user", ASCENDING), ("isRecurring", ASCENDING), ("recurrenceEnd", ASCENDING)]),
+        IndexModel([("providerId", ASCENDING), ("user", ASCENDING)]),
+        IndexModel([("meetsections", ASCENDING), ("user", ASCENDING)]),
+        IndexModel([("isRecurring", ASCENDING), ("occurrencesUntil", ASCENDING)]),
+        _text_index
+    ]
+    # `$text` queries fail without it
+    _required_indexes = [_text_index]
 
     def __init__(self,
                  meetspace: str = None,
@@ -70,6 +87,27 @@ class EventBase(Entity):
         self.updated = updated
         self.isDeleted = isDeleted
 
+    def update_recurrence_end(self):
+        """Store the start of the last occurrence in `recurrenceEnd`, once the recurrence is set from a provider.
+
+        Hydrating an event never expands its rules, `recurrenceEnd` is read from the document.
+        """
+        self.recurrenceEnd = get_recurrence_end(self.recurrence, self.start) if self.recurrence else None
+
+    def json(self):
+        result = super().json()
+        # Stored even when False, the queries skip `active: False`
+        result["active"] = self.active
+        result["isRecurring"] = bool(self.isRecurring)
+        return result
+
+    @classmethod
+    def is_active_document(cls, document):
+        """`active` of a stored document, computed for the ones stored before the flag."""
+        if "active" in document:
+            return document["active"]
+        return not document.get("isDeleted") and document.get("status") != cls.Status.CANCELLED.value
+
     # Properties
 
     @property
@@ -201,12 +239,6 @@ class EventBase(Entity):
     @recurrence.setter
     def recurrence(self, value):
         self._recurrence = value
-        if (not self._recurrence_end) and self._recurrence:
-            for rule in self.recurrence:
-                if rule.startswith("RRULE") and \
-                        (("COUNT" in rule) or ("UNTIL" in rule)):
-                    st = get_start_times(self._recurrence, start=self.start)
-                    self.recurrenceEnd = st[-1]
 
     @property
     def isRecurring(self):
@@ -290,6 +322,12 @@ class EventBase(Entity):
     def isDeleted(self, value):
         self._is_deleted = value
 
+    @property
+    def active(self):
+        """Neither deleted nor cancelled, kept on the document for the queries."""
+        status = getattr(self, "_status", None)
+        return not self.isDeleted and status != self.Status.CANCELLED
+
     # Enums
 
     # <editor-fold desc="Event Status Enum" default="collapsed">
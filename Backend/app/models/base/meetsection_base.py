@@ -1,5 +1,7 @@
 from enum import Enum
 
+from pymongo import IndexModel, ASCENDING
+
 from app.utils import validation
 from app.models.base.entity import Entity
 
@@ -8,6 +10,9 @@ class MeetsectionBase(Entity):
     _collection = 'meetsections'
     _resource_prefix = 'SEC'
     _required_fields = ["name"]
+    _indexes = Entity._indexes + [
+        IndexModel([("members.email", ASCENDING)])
+    ]
 
     def __init__(self,
                  name: str = None,
@@ -1,3 +1,5 @@
+from pymongo import IndexModel, ASCENDING
+
 from app.utils import validation
 from app.models.base.entity import Entity
 
@@ -6,6 +8,9 @@ class MeetspaceBase(Entity):
     _collection = 'meetspaces'
     _resource_prefix = 'MSP'
     _required_fields = ["name", "owners", "meetspace"]
+    _indexes = Entity._indexes + [
+        IndexModel([("name", ASCENDING)])
+    ]
 
     def __init__(self,
                  name: str = None,
@@ -1,8 +1,9 @@
-import pytz
-
 from enum import Enum
 from typing import Union
 
+from pymongo import IndexModel, ASCENDING
+
+from app.utils import validation
 from app.models.base.entity import Entity
 from app.models.base.account import Account
 
@@ -11,6 +12,9 @@ class UserBase(Entity):
     _collection = 'users'
     _resource_prefix = 'USR'
     _required_fields = ["primaryAccount"]
+    _indexes = Entity._indexes + [
+        IndexModel([("accounts.email", ASCENDING), ("accounts.type", ASCENDING)])
+    ]
 
     def __init__(self,
                  primaryAccount: Union[Account.Type, str] = None,
@@ -70,7 +74,7 @@ class UserBase(Entity):
     def timeZone(self, value):
         if not value:
             return
-        pytz.timezone(value)  # For validating timezone value
+        validation.check_timezone("Time Zone", value)
         self._time_zone = value
 
     @property
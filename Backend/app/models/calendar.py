@@ -10,6 +10,7 @@ import requests
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError as GoogleHttpError
 
+from app.extensions import db
 from app.models.event import Event
 from app.models.base.calendar_base import CalendarBase
 from app.models.base.event_base import VideoConferenceType
@@ -19,6 +20,7 @@ logger = logging.getLogger(__name__)
 
 class Calendar(CalendarBase):
     CALENDAR_MAX_END = "2050-12-31 23:59:59.999Z"
+    PAGE_SIZE = 50
 
     def get_service(self):
         if not self._service:
@@ -239,77 +241,104 @@ class Calendar(CalendarBase):
     def watch_microsoft_calendar(self):
         pass
 
-    def sync_events(self):
+    def sync_events(self, keep_lease=None):
+        """Reconcile the provider's events page by page.
+
+        `keep_lease` is called after every page, it renews the sync lease and raises
+        `LeaseLost` when another worker took it, before the page is checkpointed.
+        """
         from app.models.meetsection import Meetsection
-        changed_meetsections = []
+        from app.models.reconciliation import EventReconciler
+        changed_meetsections = set()
+        reconciler = EventReconciler(self._account)
         if self.provider == "google":
-            events = self.fetch_google_events()
-            changed_meetsections = Event.sync_google_events(events, self._account)
+            for events in self.fetch_google_events():
+                changed_meetsections |= reconciler.reconcile_google(events)
+                if keep_lease:
+                    keep_lease()
         elif self.provider == "microsoft":
-            events = self.fetch_microsoft_events()
-            changed_meetsections = Event.sync_microsoft_events(events, self._account)
+            for events in self.fetch_microsoft_events():
+                changed_meetsections |= reconciler.reconcile_microsoft(events)
+                if keep_lease:
+                    keep_lease()
         self.lastSyncedAt = datetime.utcnow()
         if changed_meetsections:
             Meetsection.bulk_update_firebase(list(changed_meetsections), self._account.get_user())
         self.save()
 
+    def checkpoint(self, **checkpoint):
+        """Persist where a paged sync has got to, so a failed sync resumes from the last committed page."""
+        self.syncCheckpoint = checkpoint
+        if checkpoint:
+            self.save()
+        elif self.id:
+            db.get_conn()[self._collection].update_one({"id": self.id}, {"$unset": {"syncCheckpoint": ""}})
+
     def fetch_google_events(self):
+        """Yields events page by page. The next page token is checkpointed once a page has been consumed."""
         service = self.get_service()
-        sync_token = self.syncToken
-        now = datetime.utcnow().isoformat() + 'Z' if not sync_token else None
-        events = []
-        page_token = None
+        checkpoint = self.syncCheckpoint
+        sync_token = checkpoint.get("syncToken", self.syncToken)
+        time_min = checkpoint.get("timeMin")
+        if not (sync_token or time_min):
+            time_min = datetime.utcnow().isoformat() + 'Z'
+        page_token = checkpoint.get("pageToken")
         while True:
-            params = {"calendarId": "primary", "pageToken": page_token,
-                      "syncToken": sync_token, "timeMin": now}
+            params = {"calendarId": "primary", "pageToken": page_token, "syncToken": sync_token,
+                      "timeMin": time_min, "maxResults": self.PAGE_SIZE}
             request = service.events().list(**params)
             try:
                 result = request.execute()
             except GoogleHttpError as e:
                 if not e.resp.status == 410:
                     raise
-                params.pop("syncToken", None)
-                params["timeMin"] = self._account.get_user().createdAt
+                # Sync token (or the checkpointed page token) is gone, start over with a full sync
+                sync_token = page_token = None
+                time_min = self._account.get_user().createdAt.isoformat() + 'Z'
+                params.update({"pageToken": page_token, "syncToken": sync_token, "timeMin": time_min})
                 result = service.events().list(**params).execute()
+            yield result.get('items', [])
             page_token = result.get('nextPageToken')
-            events += result.get('items')
             if not page_token:
-                sync_token = result.get('nextSyncToken')
+                self.syncToken = result.get('nextSyncToken')
+                self.checkpoint()
                 break
-        self.syncToken = sync_token
-        return events
+            self.checkpoint(pageToken=page_token, syncToken=sync_token, timeMin=time_min)
 
     def fetch_microsoft_events(self):
+        """Yields events page by page. The next skip token is checkpointed once a page has been consumed."""
         service = self.get_service()
         graph_url = 'https://graph.microsoft.com/v1.0'
-        sync_token = self.syncToken
-        now = datetime.utcnow().isoformat() + 'Z' if not sync_token else None
-        end = self.CALENDAR_MAX_END if not sync_token else None
-        events = []
-        page_token = None
+        checkpoint = self.syncCheckpoint
+        page_token = checkpoint.get("pageToken")
+        sync_token = self.syncToken if not page_token else None
+        if page_token:
+            now, end = checkpoint.get("timeMin"), checkpoint.get("timeMax")
+        else:
+            now = datetime.utcnow().isoformat() + 'Z' if not sync_token else None
+            end = self.CALENDAR_MAX_END if not sync_token else None
+        headers = {"Prefer": f"odata.maxpagesize={self.PAGE_SIZE}"}
         while True:
             params = {"StartDateTime": now, "EndDateTime": end,
                       "$deltatoken": sync_token, "$skiptoken": page_token}
-            headers = {"Prefer": "odata.maxpagesize=50"}
             result = service.get(f"{graph_url}/me/calendarView/delta", params=params, headers=headers)
             try:
                 result.raise_for_status()
             except requests.exceptions.HTTPError as e:
                 if not e.response.status_code == 410:
                     raise
-                params = {"StartDateTime": self._account.get_user().createdAt, "EndDateTime": end}
+                now, end = self._account.get_user().createdAt.isoformat() + 'Z', self.CALENDAR_MAX_END
+                params = {"StartDateTime": now, "EndDateTime": end}
                 result = service.get(f"{graph_url}/me/calendarView/delta", params=params, headers=headers)
                 result.raise_for_status()
             result = result.json()
-            events += result.get('value')
+            yield result.get('value', [])
             next_link = result.get('@odata.nextLink')
             if not next_link:
                 delta_link = result.get('@odata.deltaLink')
-                sync_token = parse.parse_qs(parse.urlparse(delta_link).query).get('$deltatoken')[0]
+                self.syncToken = parse.parse_qs(parse.urlparse(delta_link).query).get('$deltatoken')[0]
+                self.checkpoint()
                 break
             page_token = parse.parse_qs(parse.urlparse(next_link).query).get('$skiptoken')[0]
             sync_token = None
-        self.syncToken = sync_token
-        self.lastSyncedAt = datetime.utcnow()
-        self.save()
-        return events
+            self.checkpoint(pageToken=page_token, timeMin=now, timeMax=end)
@@ -0,0 +1,70 @@
+import contextvars
+
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+_directory = contextvars.ContextVar('user_directory', default=None)
+
+
+class UserDirectory:
+    """Email to account lookup of our users, batched and memoized DataLoader style.
+
+    Emails queued with `prime` are resolved together, with a single query, on the
+    next `load`. Results are kept for the lifetime of the directory, which is the
+    current request, or a `scope()` block outside of requests.
+    """
+
+    def __init__(self):
+        self.accounts = dict()
+        self.pending = set()
+
+    @classmethod
+    def current(cls):
+        directory = _directory.get()
+        if directory is not None:
+            return directory
+        if has_request_context():
+            if "user_directory" not in g:
+                g.user_directory = cls()
+            return g.user_directory
+        return cls()
+
+    @classmethod
+    @contextmanager
+    def scope(cls):
+        """Share one directory in the block, the request's directory when there is one."""
+        if _directory.get() is not None or has_request_context():
+            yield cls.current()
+            return
+        token = _directory.set(cls())
+        try:
+            yield _directory.get()
+        finally:
+            _directory.reset(token)
+
+    def prime(self, emails):
+        self.pending.update(email for email in emails if email and email not in self.accounts)
+
+    def prime_events(self, events):
+        """Queue the organizers and attendees of event documents."""
+        for event in events:
+            self.prime([event.get("organizer")] + [a.get("email") for a in event.get("attendees") or []])
+
+    def load(self, emails):
+        """Primary accounts of the users having the given emails, as `{email: account}`."""
+        self.prime(emails)
+        self.dispatch()
+        return {email: self.accounts[email] for email in emails if self.accounts.get(email)}
+
+    def dispatch(self):
+        if not self.pending:
+            return
+        from app.models.user import User
+        emails, self.pending = list(self.pending), set()
+        for email in emails:
+            self.accounts[email] = None
+        projection = {"accounts.email": 1, "accounts.name": 1, "accounts.imageUrl": 1}
+        for user in User.find({"accounts.email": {"$in": emails}}, projection=projection):
+            account = user["accounts"][0]
+            self.accounts[account["email"]] = account
@@ -1,11 +1,19 @@
 import pytz
+import logging
 import datetime
 
-from pymongo.operations import UpdateOne
+import numpy as np
+
+from pymongo import IndexModel, ASCENDING
 
 from app.models.followup import FollowUp
+from app.models.sync_state import SyncState
+from app.models.base.entity import Entity
 from app.models.base.event_base import EventBase
-from app.utils.datetime import get_start_times, get_datetime, get_rrule_from_pattern
+from app.utils.datetime import get_start_times, get_start_times_array, get_datetime, get_rrule_from_pattern, \
+    get_timezone, get_utc_offsets
+
+logger = logging.getLogger(__name__)
 
 GOOGLE_RESPONSE_STATUS_MAP = {'accepted': 'accepted', 'needsAction': 'none',
                               'declined': 'declined', 'tentative': 'tentative'}
@@ -14,50 +22,19 @@ MICROSOFT_RESPONSE_STATUS_MAP = {'none': 'none', 'tentativelyAccepted': 'tentati
                                  'organizer': 'accepted', 'accepted': 'accepted',
                                  'declined': 'declined', 'notResponded': 'none'}
 
+# Exception lookups done with one `$in` query for many series, and the per series queries they replaced
+exception_prefetch_stats = {"queries": 0, "saved": 0}
+
+# "%I:%M %p" of every minute of the day, indexed by hour * 60 + minute
+FIREBASE_TIME_LABELS = [f"{(h % 12) or 12:02d}:{m:02d} {'AM' if h < 12 else 'PM'}"
+                        for h in range(24) for m in range(60)]
+
 
 class Event(EventBase):
     @classmethod
     def sync_google_events(cls, events, account):
-        user = account.get_user_id()
-
-        _events = cls.find({"providerId": {"$in": [ev["id"] for ev in events]}})
-        meetsection_ids = []
-        for _ev in _events:
-            meetsection_ids += _ev["meetsections"]
-        _meetsections = cls.find({"id": {"$in": list(set(meetsection_ids))}, "members.email": account.email})
-        _meetsections_ids = [m["id"] for m in _meetsections]
-        changed_meetsections = set()
-        if events:
-            bulk_write_data = {"events": [], "recurring_exception_events": []}
-            REE = RecurringExceptionEvent
-            for ev in events:
-                _id = None
-                meetsections = []
-                event_objects = list(filter(lambda e: e["providerId"] == ev["id"], _events))
-                if event_objects:
-                    user_event_object = list(filter(lambda e: e["user"] == user, event_objects))
-                    if user_event_object:
-                        meetsections = user_event_object[0]["meetsections"]
-                        _id = user_event_object[0]['id']
-                    else:
-                        for event_object in event_objects:
-                            meetsections += [m for m in event_object["meetsections"] if m in _meetsections_ids]
-                if not meetsections:
-                    from app.models.meetsection import Meetsection
-                    meetsections = [Meetsection.get_default(account.email).id]
-                meetsections = list(set(meetsections))
-                recurring_event_id = ev.get("recurringEventId")
-                params = {"meetsections": meetsections, "user": user, "id": _id}
-                event = Event(**params) if not recurring_event_id else REE(**params)
-                event.recurringEventProviderId = recurring_event_id
-                event.from_google_event(ev)
-                operation = UpdateOne({"providerId": event.providerId, "user": user},
-                                      {"$set": event.json()}, upsert=True)
-                bulk_write_data[event._collection].append(operation)
-                changed_meetsections = set(meetsections)
-            Event.bulk_write(bulk_write_data['events'])
-            REE.bulk_write(bulk_write_data['recurring_exception_events'])
-        return changed_meetsections
+        from app.models.reconciliation import EventReconciler
+        return EventReconciler(account).reconcile_google(events)
 
     def from_google_event(self, ev):
         utc_now = datetime.datetime.utcnow()
@@ -103,6 +80,7 @@ class Event(EventBase):
         self.webLink = ev.get("htmlLink")
         self.recurrence = ev.get("recurrence")
         self.isRecurring = ev.get("recurrence") is not None
+        self.update_recurrence_end()
         if not self.id:
             self.id = self.generate_id()
             self.createdAt = utc_now
@@ -135,51 +113,8 @@ class Event(EventBase):
 
     @classmethod
     def sync_microsoft_events(cls, events, account):
-        service = account.get_service()
-        user = account.get_user_id()
-        _events = cls.find({"providerId": {"$in": [ev["id"] for ev in events]}})
-        meetsection_ids = []
-        for _ev in _events:
-            meetsection_ids += _ev["meetsections"]
-        _meetsections = cls.find({"id": {"$in": list(set(meetsection_ids))}, "members.email": account.email})
-        _meetsections_ids = [m["id"] for m in _meetsections]
-        changed_meetsections = set()
-        if events:
-            bulk_write_data = {"events": [], "recurring_exception_events": []}
-            REE = RecurringExceptionEvent
-            for ev in events:
-                if ev.get("type") == "occurrence":
-                    continue
-                _id = None
-                meetsections = []
-                event_objects = list(filter(lambda e: e["providerId"] == ev["id"], _events))
-                if event_objects:
-                    user_event_object = list(filter(lambda e: e["user"] == user, event_objects))
-                    if user_event_object:
-                        _id = user_event_object[0]['id']
-                        meetsections = user_event_object[0]["meetsections"]
-                    else:
-                        for event_object in event_objects:
-                            meetsections += [m for m in event_object["meetsections"] if m in _meetsections_ids]
-                if not meetsections:
-                    from app.models.meetsection import Meetsection
-                    meetsections = [Meetsection.get_default(account.email).id]
-                meetsections = list(set(meetsections))
-                recurring_event_id = ev.get("seriesMasterId")
-                params = {"meetsections": meetsections, "user": user, "id": _id}
-                event = Event(**params) if not recurring_event_id else REE(**params)
-                event.recurringEventProviderId = recurring_event_id
-                if ev.get("@removed"):
-                    event.isDeleted = True
-                else:
-                    event.from_microsoft_event(ev, service)
-                operation = UpdateOne({"providerId": event.providerId, "user": user},
-                                      {"$set": event.json()}, upsert=True)
-                changed_meetsections |= set([m["id"] for m in meetsections])
-                bulk_write_data[event._collection].append(operation)
-            Event.bulk_write(bulk_write_data['events'])
-            REE.bulk_write(bulk_write_data['recurring_exception_events'])
-        return changed_meetsections
+        from app.models.reconciliation import EventReconciler
+        return EventReconciler(account).reconcile_microsoft(events)
 
     def from_microsoft_event(self, ev, service):
         utc_now = datetime.datetime.utcnow()
@@ -225,6 +160,7 @@ class Event(EventBase):
         rp = ev.get("recurrence")
         self.recurrence = get_rrule_from_pattern(rp)
         self.isRecurring = rp is not None
+        self.update_recurrence_end()
         if not self.id:
             self.id = self.generate_id()
             self.createdAt = utc_now
@@ -251,75 +187,142 @@ class Event(EventBase):
             [microsoft_object.pop(k, None) for k in microsoft_object.copy() if k not in keys]
         return microsoft_object
 
-    def expand(self, end=None, calendar=False, timezone=None):
+    def expand(self, end=None, calendar=False, timezone=None, exceptions=None, start=None):
         if not self.isRecurring:
             raise ValueError("Tried to expand non recurring event")
 
-        start_times = get_start_times(self.recurrence, self.start, get_datetime(end))
+        if timezone is None or isinstance(timezone, str):
+            timezone = get_timezone(timezone if timezone else 'UTC')
+        start_times = get_start_times_array(self.recurrence, self.start, get_datetime(end), window_start=start)
         instances = []
-        exceptions = RecurringExceptionEvent.find({"recurringEventProviderId": self.providerId})
+        if exceptions is None:
+            exceptions = RecurringExceptionEvent.find({"recurringEventProviderId": self.providerId}, inactive=True)
+        exceptions = self.index_exceptions(exceptions)
         clone = self.to_simple_object(timezone=timezone) if not calendar else self.to_calendar_object()
-        for st in start_times:
+        for st, rendered in zip(start_times.tolist(), self.render_instances(start_times, timezone)):
             st = st.replace(tzinfo=pytz.utc)
-            instance = self.get_instance_from_event(st, exceptions, clone,
-                                                    calendar=calendar, timezone=timezone)
+            instance = self.get_instance_from_event(st, exceptions, clone, calendar=calendar,
+                                                    timezone=timezone, rendered=rendered)
             if not instance:
                 continue
             instances.append(instance)
+        if start is not None and end is not None:
+            instances += self.get_moved_instances(start_times, exceptions, clone, start, end, calendar=calendar,
+                                                  timezone=timezone)
+        return instances
+
+    def get_moved_instances(self, start_times, exceptions, clone, start, end, calendar=False, timezone=None):
+        """Instances of the exceptions moved into `[start, end)` from an occurrence out of `start_times`.
+
+        `expand` only walks the occurrences of the window, an exception replacing one
+        before or after it would be missed.
+        """
+        start = get_datetime(start)
+        end = get_datetime(end)
+        expanded = set(st.strftime('%Y%m%dT%H%M%SZ') for st in start_times.tolist())
+        instances = []
+        for key, exception in exceptions.items():
+            if key in expanded or not self.is_active_document(exception):
+                continue
+            if start <= get_datetime(exception["start"]) < end:
+                instances.append(self.get_instance_from_event(get_datetime(exception["originalStart"]), exceptions,
+                                                              clone, calendar=calendar, timezone=timezone))
         return instances
 
-    def expand_for_firebase(self, timezone=None):
+    def expand_for_firebase(self, timezone=None, exceptions=None):
         if not self.isRecurring:
             raise ValueError("Tried to expand non recurring event")
 
-        start_times = get_start_times(self.recurrence, self.start)
-        exceptions = RecurringExceptionEvent.find({"recurringEventProviderId": self.providerId})
+        if timezone is None or isinstance(timezone, str):
+            timezone = get_timezone(timezone if timezone else 'UTC')
+        start_times = get_start_times_array(self.recurrence, self.start)
+        if exceptions is None:
+            exceptions = RecurringExceptionEvent.find({"recurringEventProviderId": self.providerId}, inactive=True)
+        exceptions = self.index_exceptions(exceptions)
         clone = self.to_simple_object(timezone=timezone)
         parent = clone.copy()
         parent["recurringEvents"] = dict()
-        for st in start_times:
+        for st, rendered in zip(start_times.tolist(), self.render_instances(start_times, timezone)):
             st = st.replace(tzinfo=pytz.utc)
-            instance = self.get_instance_from_event(st, exceptions, clone, timezone=timezone)
+            instance = self.get_instance_from_event(st, exceptions, clone, timezone=timezone, rendered=rendered)
             if not instance:
                 continue
-            start = get_datetime(instance["start"]["date"])
-            if start.year not in parent["recurringEvents"]:
-                parent["recurringEvents"][start.year] = dict()
-            if start.month not in parent["recurringEvents"][start.year]:
-                parent["recurringEvents"][start.year][start.month] = dict()
-            parent["recurringEvents"][start.year][start.month][start.day] = instance
+            year, month, day = map(int, instance["start"]["date"].split('-'))
+            if year not in parent["recurringEvents"]:
+                parent["recurringEvents"][year] = dict()
+            if month not in parent["recurringEvents"][year]:
+                parent["recurringEvents"][year][month] = dict()
+            parent["recurringEvents"][year][month][day] = instance
         return parent
 
-    def get_instance_from_event(self, start, exceptions, clone, calendar=False, timezone=None):
-        REE = RecurringExceptionEvent
-        duration = self.end - self.start
+    def render_instances(self, start_times, timezone):
+        """Rendered `(start, end)` of the instances starting at `start_times`, a naive UTC `datetime64` array."""
+        duration = np.timedelta64(self.end - self.start, 'us')
+        return zip(_get_datetimes_for_firebase(start_times, timezone),
+                   _get_datetimes_for_firebase(start_times + duration, timezone))
+
+    @staticmethod
+    def index_exceptions(exceptions):
+        """Index exception documents of a series by the UTC timestamp of the occurrence they replace."""
+        index = dict()
+        for exception in exceptions:
+            if exception.get("originalStart"):
+                original_start = get_datetime(exception["originalStart"]).astimezone(pytz.utc)
+                index[original_start.strftime('%Y%m%dT%H%M%SZ')] = exception
+        return index
+
+    def get_instance_from_event(self, start, exceptions, clone, calendar=False, timezone=None, rendered=None):
+        """Instance of the series starting at `start`, `None` when it is cancelled.
+
+        `rendered` is the `(start, end)` pair of the instance from `render_instances`, when already rendered.
+        """
         if timezone is None or isinstance(timezone, str):
-            timezone = pytz.timezone(timezone if timezone else 'UTC')
-        ree = REE(recurringEventProviderId=self.providerId, originalStart=start)
-        exception = list(filter(lambda o: o["id"] == ree.generate_id(), exceptions))
+            timezone = get_timezone(timezone if timezone else 'UTC')
+        if rendered is None:
+            rendered = (_get_datetime_for_firebase(start, timezone),
+                        _get_datetime_for_firebase(start + (self.end - self.start), timezone))
+        start_key = rendered[0]["utc"].replace('-', '').replace(':', '')
+        exception = exceptions.get(start_key)
         if exception:
-            if exception[0]['status'] == "cancelled":
+            if exception['status'] == "cancelled":
                 return
-            instance_obj = REE(**exception[0])
-            if not calendar:
-                instance = instance_obj.to_simple_object(timezone=timezone)
-            else:
-                instance = instance_obj.to_calendar_object()
+            instance = self.get_exception_instance(exception, clone, calendar=calendar, timezone=timezone)
         else:
             instance = clone.copy()
-            end = start + duration
             if not calendar:
-                instance["start"] = _get_datetime_for_firebase(start, timezone)
-                instance["end"] = _get_datetime_for_firebase(end, timezone)
+                instance["start"], instance["end"] = rendered
             else:
-                instance["start"] = start.strftime('%Y-%m-%dT%H:%M:%SZ')
-                instance["end"] = end.strftime('%Y-%m-%dT%H:%M:%SZ')
-        instance["id"] = self.id + '__' + start.strftime('%Y%m%dT%H%M%SZ')
+                instance["start"], instance["end"] = rendered[0]["utc"], rendered[1]["utc"]
+        instance["id"] = self.id + '__' + start_key
+        return instance
+
+    def get_exception_instance(self, exception, clone, calendar=False, timezone=None):
+        """Serialize an exception of this series.
+
+        Attendee details are taken from the series' serialized clone, unless the
+        exception changed its attendees.
+        """
+        if calendar:
+            return CalendarItem(exception).to_calendar_object()
+        same_attendees = exception.get("organizer") == self.organizer and \
+            list(map(_attendee_key, exception.get("attendees", []))) == list(map(_attendee_key, self.attendees))
+        if same_attendees:
+            attendees = clone["attendees"]
+        else:
+            attendees = EventSummary(exception).get_attendees()
+        instance = {
+            "id": exception["id"],
+            "title": exception.get("title"),
+            "description": exception.get("description"),
+            "attendees": attendees,
+            "end": _get_datetime_for_firebase(exception["end"], timezone),
+            "start": _get_datetime_for_firebase(exception["start"], timezone)
+        }
         return instance
 
     def next_start_end_in_series(self):
         utc_now = datetime.datetime.utcnow()
-        start_times = get_start_times(self.recurrence, start=utc_now)
+        start_times = get_start_times(self.recurrence, self.start, window_start=utc_now)
         duration = self.end - self.start
         if start_times:
             return start_times[0], start_times[0] + duration
@@ -327,52 +330,17 @@ class Event(EventBase):
             return None, None
 
     def get_attendees(self):
-        from app.models.user import User
-        users = User.find({"accounts.email": {"$in": [a["email"] for a in self.attendees] + [self.organizer]}})
-        attendees = []
-        _attendee = {"email": self.organizer, "type": "organizer"}
-        _user = list(filter(lambda u: u["accounts"][0]["email"] == self.organizer, users))
-        if _user:
-            _attendee["displayName"] = _user[0]["accounts"][0]["name"]
-            _attendee["imageUrl"] = _user[0]["accounts"][0]["imageUrl"]
-        attendees.append(_attendee)
-        for _attendee in self.attendees:
-            email = _attendee["email"]
-            if not email == self.organizer:
-                _user = list(filter(lambda u: u["accounts"][0]["email"] == email, users))
-                if _user:
-                    _attendee["displayName"] = _user[0]["accounts"][0]["name"]
-                    _attendee["imageUrl"] = _user[0]["accounts"][0]["imageUrl"]
-                attendees.append(_attendee)
-        return attendees
+        return EventSummary.from_event(self).get_attendees()
 
     def to_simple_object(self, timezone=None):
-        if timezone is None or isinstance(timezone, str):
-            timezone = pytz.timezone(timezone if timezone else 'UTC')
-        ev = {
-            "id": self.id,
-            "title": self.title,
-            "description": self.description,
-            "attendees": self.get_attendees()
-        }
-        if self.recurrence:
-            ev["recurrence"] = {
-                "rule": "\n".join(self.recurrence),
-                "recurrenceText": self.recurrenceText
-            }
-            if self.recurrenceEnd:
-                end = self.recurrenceEnd + (self.end - self.start)
-                ev["end"] = _get_datetime_for_firebase(end, timezone)
-        else:
-            ev["end"] = _get_datetime_for_firebase(self.end, timezone)
-        ev["start"] = _get_datetime_for_firebase(self.start, timezone)
-        return ev
+        return EventSummary.from_event(self).to_simple_object(timezone=timezone)
 
     def to_full_object(self, user_id, timezone=None):
         result = self.to_simple_object(timezone=timezone)
         result["organizer"] = self.organizer
         from app.models.meetsection import Meetsection
-        meetsections = Meetsection.find({"id": {"$in": self.meetsections}})
+        meetsections = Meetsection.find({"id": {"$in": self.meetsections}},
+                                        projection={"id": 1, "name": 1, "members.email": 1})
         result["meetsections"] = []
         for _m in meetsections:
             result["meetsections"].append({
@@ -385,27 +353,35 @@ class Event(EventBase):
         elif self.followUp:
             follow_up = FollowUp.find_one({"id": self.followUp})
             follow_up_events = self.find({"id": {"$in": follow_up.events}})
-            result["followUpEvents"] = [Event(**fe).to_simple_object(timezone=timezone) for fe in follow_up_events]
+            from app.models.directory import UserDirectory
+            UserDirectory.current().prime_events(follow_up_events)
+            result["followUpEvents"] = [EventSummary(fe).to_simple_object(timezone=timezone) for fe in follow_up_events]
         return result
 
     def to_calendar_object(self):
-        if self.isAllDay:
-            end = self.end - datetime.timedelta(seconds=1)
-        else:
-            end = self.end
-        return {
-            "id": self.id,
-            "calendarId": "1",
-            "title": self.title,
-            "body": self.description,
-            "start": self.start.strftime('%Y-%m-%dT%H:%M:%SZ'),
-            "end": end.strftime('%Y-%m-%dT%H:%M:%SZ'),
-            "isAllDay": self.isAllDay,
-            "attendees": [a["email"] for a in self.attendees],
-            "location": self.location,
-            "recurrenceRule": self.recurrenceText,
-            "category": "time"
-        }
+        return CalendarItem.from_event(self).to_calendar_object()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        series = self.get_series_provider_id()
+        if series:
+            from app.models.occurrence import EventOccurrence
+            EventOccurrence.refresh(self.user, [series])
+        SyncState(self.user).bump_version()
+
+    def get_series_provider_id(self):
+        """Provider id of the series whose occurrences depend on this event, `None` for plain events."""
+        if self.isRecurring:
+            return self.providerId
+
+    @classmethod
+    def fetch_cached_by_date_range(cls, start, end, user, calendar=False):
+        """`fetch_by_date_range`, served from the range cache until the user's events change."""
+        from app.extensions import range_cache
+        start = get_datetime(start)
+        end = get_datetime(end)
+        key = (user, start, end, calendar, SyncState(user).get_version())
+        return range_cache.get(key, lambda: cls.fetch_by_date_range(start, end, user, calendar=calendar))
 
     @classmethod
     def fetch_by_date_range(cls, start, end, user, calendar=False):
@@ -413,44 +389,119 @@ class Event(EventBase):
         end = get_datetime(end)
         non_recurring_query = {
             "start": {"$gte": start, "$lt": end},
-            "isRecurring": False,
-            "status": {"$ne": "cancelled"},
-            "user": user,
-            "$or": [{"isDeleted": {"$exists": False}}, {"isDeleted": False}]
+            "isRecurring": {"$ne": True},
+            "user": user
         }
-        non_recurring_events = cls.find(non_recurring_query)
-        if not calendar:
-            to_ret = [cls(**ev).to_simple_object() for ev in non_recurring_events]
-        else:
-            to_ret = [cls(**ev).to_calendar_object() for ev in non_recurring_events]
         recurring_query = {
             "isRecurring": True,
-            "status": {"$ne": "cancelled"},
             "$and": [{"$or": [{"recurrenceEnd": {"$exists": False}},
                               {"$and": [{"recurrenceEnd": {"$gte": start}},
                                         {"start": {"$lt": end}}]}]},
-                     {"$or": [{"isDeleted": {"$exists": False}},
-                              {"isDeleted": False}]}],
+                     {"$or": [{"occurrencesUntil": {"$exists": False}},
+                              {"occurrencesUntil": {"$lt": end}},
+                              {"occurrencesSince": {"$gt": start}}]}],
             "user": user
         }
-        recurring_events = cls.find(recurring_query)
-        for _e in recurring_events:
-            e = cls(**_e)
-            expanded = e.expand(end, calendar=calendar)
+
+        # Series not materialized over the whole range are expanded on the fly
+        stale_events = cls.find(recurring_query)
+        stale_exceptions = RecurringExceptionEvent.find_for_masters([_e["providerId"] for _e in stale_events])
+        if any(not _e.get("occurrencesUntil") for _e in stale_events):
+            from flask import current_app
+            current_app.after_response.enqueue("materialize_occurrences", key=f"materialize_occurrences:{user}",
+                                               user_id=user)
+
+        # Everything else is a single scan over the materialized occurrences
+        from app.models.occurrence import EventOccurrence
+        occurrence_query = {"user": user, "start": {"$gte": start, "$lt": end},
+                            "event": {"$nin": [_e["id"] for _e in stale_events]}}
+        occurrences = EventOccurrence.find(occurrence_query, sort=[("start", 1)])
+        masters = []
+        exceptions = dict()
+        if occurrences:
+            master_query = {"id": {"$in": list(set(o["event"] for o in occurrences))}}
+            masters = cls.find(master_query)
+            exception_ids = [o["exception"] for o in occurrences if o.get("exception")]
+            if exception_ids:
+                exceptions = {ree["id"]: ree for ree in RecurringExceptionEvent.find({"id": {"$in": exception_ids}})}
+
+        # Plain events are streamed, the attendees of each batch are resolved together
+        to_ret = []
+        if not calendar:
+            from app.models.directory import UserDirectory
+            directory = UserDirectory.current()
+            directory.prime_events(stale_events + masters + list(exceptions.values()))
+            directory.prime_events(ree for _exceptions in stale_exceptions.values() for ree in _exceptions)
+            for batch in cls.stream_batches(non_recurring_query, projection=EventSummary.projection):
+                directory.prime_events(batch)
+                to_ret += [EventSummary(ev).to_simple_object() for ev in batch]
+        else:
+            for ev in cls.stream(non_recurring_query, projection=CalendarItem.projection):
+                to_ret.append(CalendarItem(ev).to_calendar_object())
+
+        for _e in stale_events:
+            e = cls.from_db(_e)
+            expanded = e.expand(end, calendar=calendar, exceptions=stale_exceptions.get(e.providerId, []),
+                                start=start)
             if not calendar:
                 to_ret += list(filter(lambda i: start <= get_datetime(i["start"]["utc"]) < end, expanded))
             else:
                 to_ret += list(filter(lambda i: start <= get_datetime(i["start"]) < end, expanded))
+
+        if not occurrences:
+            return to_ret
+        masters = {_e["id"]: cls.from_db(_e) for _e in masters}
+        clones = dict()
+        original_starts = np.array([o["originalStart"] for o in occurrences], dtype='datetime64[us]')
+        ends = np.array([o["end"] for o in occurrences], dtype='datetime64[us]')
+        rendered = zip(_get_datetimes_for_firebase(original_starts, pytz.utc),
+                       _get_datetimes_for_firebase(ends, pytz.utc))
+        for occurrence, _rendered in zip(occurrences, rendered):
+            e = masters.get(occurrence["event"])
+            if not e:
+                continue
+            if e.id not in clones:
+                clones[e.id] = e.to_simple_object() if not calendar else e.to_calendar_object()
+            exception = exceptions.get(occurrence.get("exception"))
+            instance = e.get_instance_from_event(get_datetime(occurrence["originalStart"]),
+                                                 e.index_exceptions([exception] if exception else []),
+                                                 clones[e.id], calendar=calendar, rendered=_rendered)
+            if instance:
+                to_ret.append(instance)
         return to_ret
 
 
 class RecurringExceptionEvent(Event):
     _collection = 'recurring_exception_events'
+    _indexes = Entity._indexes + [
+        IndexModel([("recurringEventProviderId", ASCENDING)]),
+        IndexModel([("providerId", ASCENDING), ("user", ASCENDING)]),
+        EventBase._text_index
+    ]
 
     def __init__(self, recurringEventProviderId: str = None, *args, **kwargs):
         self.recurringEventProviderId = recurringEventProviderId
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def find_for_masters(cls, provider_ids, projection=None):
+        """Load the exceptions of many series in one query, grouped by their master's provider id."""
+        provider_ids = list(set(provider_ids))
+        grouped = {provider_id: [] for provider_id in provider_ids}
+        if not provider_ids:
+            return grouped
+        for exception in cls.find({"recurringEventProviderId": {"$in": provider_ids}}, projection=projection,
+                                  inactive=True):
+            grouped[exception["recurringEventProviderId"]].append(exception)
+        exception_prefetch_stats["queries"] += 1
+        exception_prefetch_stats["saved"] += len(provider_ids) - 1
+        logger.debug(f"Prefetched exceptions of {len(provider_ids)} series, "
+                     f"{exception_prefetch_stats['saved']} queries saved so far.")
+        return grouped
+
+    def get_series_provider_id(self):
+        return self.recurringEventProviderId
+
     def generate_id(self):
         original_start_utc = self.originalStart.astimezone(datetime.timezone.utc)
         master_id = self._recurring_event_provider_id
@@ -468,6 +519,116 @@ class RecurringExceptionEvent(Event):
         self._recurring_event_provider_id = value
 
 
+class EventSummary:
+    """Read model of an event with the fields of `to_simple_object`.
+
+    Built straight from a stored document (or an `Event`), without going through the
+    entity's property setters; `projection` selects its fields in queries.
+    """
+    __slots__ = ("id", "title", "description", "organizer", "attendees",
+                 "start", "end", "recurrence", "recurrenceText", "recurrenceEnd")
+    projection = dict.fromkeys(__slots__, 1)
+
+    def __init__(self, document):
+        self.id = document.get("id")
+        self.title = document.get("title")
+        self.description = document.get("description")
+        self.organizer = document.get("organizer")
+        self.attendees = document.get("attendees") or list()
+        self.start = get_datetime(document.get("start"))
+        self.end = get_datetime(document.get("end"))
+        self.recurrence = document.get("recurrence")
+        self.recurrenceText = document.get("recurrenceText")
+        self.recurrenceEnd = get_datetime(document.get("recurrenceEnd"))
+
+    @classmethod
+    def from_event(cls, event):
+        return cls({field: getattr(event, field) for field in cls.__slots__})
+
+    def get_attendees(self):
+        from app.models.directory import UserDirectory
+        accounts = UserDirectory.current().load([a["email"] for a in self.attendees] + [self.organizer])
+        attendees = []
+        _attendee = {"email": self.organizer, "type": "organizer"}
+        account = accounts.get(self.organizer)
+        if account:
+            _attendee["displayName"] = account["name"]
+            _attendee["imageUrl"] = account["imageUrl"]
+        attendees.append(_attendee)
+        for _attendee in self.attendees:
+            email = _attendee["email"]
+            if not email == self.organizer:
+                account = accounts.get(email)
+                if account:
+                    _attendee["displayName"] = account["name"]
+                    _attendee["imageUrl"] = account["imageUrl"]
+                attendees.append(_attendee)
+        return attendees
+
+    def to_simple_object(self, timezone=None):
+        if timezone is None or isinstance(timezone, str):
+            timezone = get_timezone(timezone if timezone else 'UTC')
+        ev = {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "attendees": self.get_attendees()
+        }
+        if self.recurrence:
+            ev["recurrence"] = {
+                "rule": "\n".join(self.recurrence),
+                "recurrenceText": self.recurrenceText
+            }
+            if self.recurrenceEnd:
+                end = self.recurrenceEnd + (self.end - self.start)
+                ev["end"] = _get_datetime_for_firebase(end, timezone)
+        else:
+            ev["end"] = _get_datetime_for_firebase(self.end, timezone)
+        ev["start"] = _get_datetime_for_firebase(self.start, timezone)
+        return ev
+
+
+class CalendarItem:
+    """Read model of an event with the fields of `to_calendar_object`."""
+    __slots__ = ("id", "title", "description", "start", "end", "isAllDay", "attendees",
+                 "location", "recurrenceText")
+    projection = dict.fromkeys(__slots__, 1)
+
+    def __init__(self, document):
+        self.id = document.get("id")
+        self.title = document.get("title")
+        self.description = document.get("description")
+        self.start = get_datetime(document.get("start"))
+        self.end = get_datetime(document.get("end"))
+        self.isAllDay = document.get("isAllDay")
+        self.attendees = document.get("attendees") or list()
+        self.location = document.get("location")
+        self.recurrenceText = document.get("recurrenceText")
+
+    @classmethod
+    def from_event(cls, event):
+        return cls({field: getattr(event, field) for field in cls.__slots__})
+
+    def to_calendar_object(self):
+        if self.isAllDay:
+            end = self.end - datetime.timedelta(seconds=1)
+        else:
+            end = self.end
+        return {
+            "id": self.id,
+            "calendarId": "1",
+            "title": self.title,
+            "body": self.description,
+            "start": self.start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "end": end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "isAllDay": self.isAllDay,
+            "attendees": [a["email"] for a in self.attendees],
+            "location": self.location,
+            "recurrenceRule": self.recurrenceText,
+            "category": "time"
+        }
+
+
 def _get_datetime(obj):
     if obj and "dateTime" in obj:
         return [obj["dateTime"], obj.get("timeZone")]
@@ -475,8 +636,27 @@ def _get_datetime(obj):
         return [obj["date"], obj.get("timeZone")]
 
 
+def _attendee_key(attendee):
+    return attendee.get("email"), attendee.get("responseStatus"), attendee.get("optional")
+
+
 def _get_datetime_for_firebase(dt, timezone):
     dt = get_datetime(dt)
-    return {"date": dt.astimezone(timezone).strftime("%Y-%m-%d"),
-            "time": dt.astimezone(timezone).strftime("%I:%M %p"),
-            "utc": dt.strftime('%Y-%m-%dT%H:%M:%SZ')}
+    if dt.utcoffset():
+        dt = dt.astimezone(pytz.utc)
+    local = dt.astimezone(timezone)
+    return {"date": f"{local.year:04d}-{local.month:02d}-{local.day:02d}",
+            "time": FIREBASE_TIME_LABELS[local.hour * 60 + local.minute],
+            "utc": f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}Z"}
+
+
+def _get_datetimes_for_firebase(instants, timezone):
+    """`_get_datetime_for_firebase` of every instant of a naive UTC `datetime64` array, in one timezone."""
+    instants = instants.astype('datetime64[s]')
+    local = instants + get_utc_offsets(instants, timezone)
+    days = local.astype('datetime64[D]')
+    dates = np.datetime_as_string(days).tolist()
+    minutes = (local.astype('datetime64[m]') - days).astype(np.int64).tolist()
+    utcs = np.datetime_as_string(instants, unit='s').tolist()
+    return [{"date": date, "time": FIREBASE_TIME_LABELS[minute], "utc": utc + 'Z'}
+            for date, minute, utc in zip(dates, minutes, utcs)]
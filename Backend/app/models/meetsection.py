@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from app.models.event import Event
+from app.models.event import Event, EventSummary, RecurringExceptionEvent as REE
+from app.models.directory import UserDirectory
 from app.extensions import firebase_service
 from app.models.base.meetsection_base import MeetsectionBase
 
@@ -16,16 +17,27 @@ class Meetsection(MeetsectionBase):
                 result[k] = v.isoformat()
         return result
 
-    def to_full_object(self, user_id, timezone=None):
+    def to_full_object(self, user_id, timezone=None, events=None, exceptions=None):
         result = self.to_simple_object()
         result["events"] = []
-        events = self.fetch_events(user_id)
-        for event in events:
-            e = Event(**event)
-            if e.isRecurring:
-                result["events"].append(e.expand_for_firebase(timezone=timezone))
-            else:
-                result["events"].append(e.to_simple_object(timezone=timezone))
+        batches = [events] if events is not None else self.fetch_events(user_id)
+        directory = UserDirectory.current()
+        # Series are expanded once their exceptions are loaded, at their place in the list
+        series = []
+        for batch in batches:
+            directory.prime_events(batch)
+            for event in batch:
+                if event.get("isRecurring"):
+                    series.append((len(result["events"]), Event.from_db(event)))
+                    result["events"].append(None)
+                else:
+                    result["events"].append(EventSummary(event).to_simple_object(timezone=timezone))
+        if exceptions is None:
+            exceptions = REE.find_for_masters([e.providerId for _, e in series])
+        directory.prime_events(ree for _exceptions in exceptions.values() for ree in _exceptions)
+        for index, e in series:
+            result["events"][index] = e.expand_for_firebase(timezone=timezone,
+                                                            exceptions=exceptions.get(e.providerId, []))
         return result
 
     def add_user(self, user_email, owner=False):
@@ -39,7 +51,7 @@ class Meetsection(MeetsectionBase):
     def get_users(self):
         query = {"accounts.email": {"$in": [member["email"] for member in self.members]}}
         from app.models.user import User
-        return User.find(query)
+        return User.find(query, projection={"id": 1, "timeZone": 1})
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -47,18 +59,33 @@ class Meetsection(MeetsectionBase):
 
     def update_firebase(self, users):
         update_obj = dict()
-        for u in users:
-            path = f"users/{u['id']}/meetsections/{self.id}"
-            update_obj[path] = self.to_full_object(u['id'], timezone=u['timeZone'])
+        with UserDirectory.scope():
+            for u in users:
+                path = f"users/{u['id']}/meetsections/{self.id}"
+                update_obj[path] = self.to_full_object(u['id'], timezone=u['timeZone'])
         firebase_service.db_update(update_obj)
 
     @classmethod
     def bulk_update_firebase(cls, meetsection_ids, user):
         insert_obj = dict()
         meetsections = Meetsection.find({"id": {"$in": meetsection_ids}})
-        for m in meetsections:
-            path = f"users/{user.id}/meetsections/{m['id']}"
-            insert_obj[path] = Meetsection(**m).to_full_object(user.id, timezone=user.timeZone)
+        events = {m["id"]: [] for m in meetsections}
+        provider_ids = []
+        for event in cls.fetch_events_for_meetsections(meetsection_ids, user.id):
+            for meetsection_id in event["meetsections"]:
+                if meetsection_id in events:
+                    events[meetsection_id].append(event)
+            if event.get("isRecurring"):
+                provider_ids.append(event["providerId"])
+        exceptions = REE.find_for_masters(provider_ids)
+        with UserDirectory.scope() as directory:
+            for meetsection_events in events.values():
+                directory.prime_events(meetsection_events)
+            for m in meetsections:
+                path = f"users/{user.id}/meetsections/{m['id']}"
+                insert_obj[path] = Meetsection.from_db(m).to_full_object(user.id, timezone=user.timeZone,
+                                                                         events=events[m["id"]],
+                                                                         exceptions=exceptions)
         firebase_service.db_update(insert_obj)
 
     @classmethod
@@ -78,9 +105,16 @@ class Meetsection(MeetsectionBase):
         return cls.find({"members.email": user_email})
 
     def fetch_events(self, user_id):
+        """Batches of the events of this meetsection, streamed."""
         from app.models.event import Event
-        return Event.find({"status": {"$ne": "cancelled"},
-                           "meetsections": self.id,
-                           "user": user_id,
-                           "$or": [{"isDeleted": {"$exists": False}},
-                                   {"isDeleted": False}]})
+        return Event.stream_batches(self.get_events_query([self.id], user_id))
+
+    @classmethod
+    def fetch_events_for_meetsections(cls, meetsection_ids, user_id):
+        """Stream the events of the given meetsections."""
+        from app.models.event import Event
+        return Event.stream(cls.get_events_query(meetsection_ids, user_id))
+
+    @staticmethod
+    def get_events_query(meetsection_ids, user_id):
+        return {"meetsections": {"$in": meetsection_ids}, "user": user_id}
@@ -0,0 +1,193 @@
+import pytz
+
+from datetime import datetime, timedelta
+
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import BulkWriteError
+from pymongo.operations import DeleteMany, ReplaceOne, UpdateMany
+
+from app import app
+from app.extensions import db
+from app.utils.datetime import get_start_times, get_datetime
+from app.models.event import Event, RecurringExceptionEvent
+
+
+class EventOccurrence:
+    """Materialized occurrences of recurring events.
+
+    Every active recurring master gets one document per occurrence, from a retention
+    window in the past up to a rolling horizon, in the `event_occurrences` collection
+    (indexed on user and start). Cancelled occurrences are left out and moved ones
+    carry the start and end of their exception. Masters record how far they have been
+    materialized in `occurrencesUntil`, and `occurrencesSince` when their series
+    started before the retention window; earlier ranges are expanded on the fly.
+
+    Occurrences are upserted by id, so concurrent rebuilds of a master, from a save, a
+    sync and the horizon job, never write an occurrence twice.
+    """
+    _collection = 'event_occurrences'
+    _id_index = IndexModel([("id", ASCENDING)], unique=True)
+    _indexes = [_id_index,
+                IndexModel([("user", ASCENDING), ("start", ASCENDING)]),
+                IndexModel([("event", ASCENDING)])]
+    # Concurrent upserts of an occurrence rely on the second insert failing
+    _required_indexes = [_id_index]
+
+    @classmethod
+    def get_collection(cls):
+        return db.get_conn()[cls._collection]
+
+    @classmethod
+    def horizon(cls):
+        return datetime.utcnow().replace(tzinfo=pytz.utc) + timedelta(days=app.config.get('OCCURRENCE_HORIZON_DAYS'))
+
+    @classmethod
+    def retention_start(cls):
+        return datetime.utcnow().replace(tzinfo=pytz.utc) - timedelta(days=app.config.get('OCCURRENCE_RETENTION_DAYS'))
+
+    @classmethod
+    def find(cls, query, sort=None):
+        return list(cls.get_collection().find(query, sort=sort))
+
+    @classmethod
+    def remove_duplicates(cls):
+        """Delete all but one of the occurrences sharing an id, the unique index cannot be built over them."""
+        duplicates = cls.get_collection().aggregate([
+            {"$group": {"_id": "$id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        for duplicate in duplicates:
+            removed += cls.get_collection().delete_many({"_id": {"$in": duplicate["ids"][1:]}}).deleted_count
+        return removed
+
+    @classmethod
+    def refresh(cls, user, provider_ids):
+        """Rebuild the occurrences of the masters of a user having the given provider ids."""
+        if not provider_ids:
+            return
+        masters = Event.find({"user": user, "providerId": {"$in": list(provider_ids)}}, inactive=True)
+        cls.materialize(masters)
+
+    @classmethod
+    def materialize_stale(cls, user):
+        """Materialize the recurring masters of a user that have never been materialized."""
+        masters = Event.find({"user": user, "isRecurring": True, "occurrencesUntil": {"$exists": False}})
+        cls.materialize(masters)
+
+    @classmethod
+    def materialize(cls, masters, until=None, extend=False):
+        """Write the occurrences of the given master documents up to `until`.
+
+        Occurrences are rebuilt from the retention window start, so the cost follows the
+        window and not the age of the series, unless `extend` is set, in which case only
+        the ones after the master's current `occurrencesUntil` are added. A rebuild deletes
+        the occurrences of the master it no longer produces.
+        """
+        until = get_datetime(until) if until else cls.horizon()
+        retention_start = cls.retention_start()
+        exceptions = dict()
+        provider_ids = [m["providerId"] for m in masters]
+        for exception in RecurringExceptionEvent.find({"recurringEventProviderId": {"$in": provider_ids}},
+                                                      inactive=True):
+            exceptions[exception["id"]] = exception
+
+        operations = []
+        materialized = []
+        retained, complete = [], []
+        stale = []
+        for master in masters:
+            since = get_datetime(master.get("occurrencesUntil")) if extend else None
+            window_start = None
+            if not since:
+                if get_datetime(master["start"]) < retention_start:
+                    window_start = retention_start
+                    retained.append(master["id"])
+                else:
+                    complete.append(master["id"])
+            materialized.append(master["id"])
+            occurrences = []
+            if cls.is_materializable(master):
+                occurrences = cls.build(Event.from_db(master), exceptions, until, since=since,
+                                        window_start=window_start)
+            operations += [ReplaceOne({"id": o["id"]}, o, upsert=True) for o in occurrences]
+            if not since:
+                stale.append(DeleteMany({"event": master["id"], "id": {"$nin": [o["id"] for o in occurrences]}}))
+
+        cls.upsert(operations)
+        if stale:
+            cls.get_collection().bulk_write(stale, ordered=False)
+        updates = []
+        if materialized:
+            updates.append(UpdateMany({"id": {"$in": materialized}}, {"$set": {"occurrencesUntil": until}}))
+        if retained:
+            updates.append(UpdateMany({"id": {"$in": retained}}, {"$set": {"occurrencesSince": retention_start}}))
+        if complete:
+            updates.append(UpdateMany({"id": {"$in": complete}}, {"$unset": {"occurrencesSince": ""}}))
+        if updates:
+            Event.get_collection().bulk_write(updates, ordered=False)
+
+    @classmethod
+    def upsert(cls, operations):
+        if not operations:
+            return
+        try:
+            cls.get_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Upserts racing another rebuild to insert the same occurrence, they replace it once it is there
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            cls.get_collection().bulk_write([operations[error["index"]] for error in errors], ordered=False)
+
+    @classmethod
+    def build(cls, event, exceptions, until, since=None, window_start=None):
+        """Occurrences up to `until`, strictly after `since` or from `window_start` on when given."""
+        duration = event.end - event.start
+        master_id = event.providerId.split('_')[0]
+        occurrences = []
+        for st in get_start_times(event.recurrence, event.start, until, window_start=since or window_start):
+            st = st.replace(tzinfo=pytz.utc)
+            if since and st <= since:
+                continue
+            occurrence = {
+                "id": event.id + '__' + st.strftime('%Y%m%dT%H%M%SZ'),
+                "event": event.id,
+                "user": event.user,
+                "originalStart": st,
+                "start": st,
+                "end": st + duration
+            }
+            exception = exceptions.get(master_id + '_' + st.strftime('%Y%m%dT%H%M%SZ'))
+            if exception:
+                if exception.get("status") == Event.Status.CANCELLED.value:
+                    continue
+                occurrence["start"] = get_datetime(exception["start"])
+                occurrence["end"] = get_datetime(exception["end"])
+                occurrence["exception"] = exception["id"]
+            occurrences.append(occurrence)
+        return occurrences
+
+    @staticmethod
+    def is_materializable(master):
+        return master.get("isRecurring") and master.get("providerId") and Event.is_active_document(master)
+
+    @classmethod
+    def extend_horizon(cls, batch_size=100, heartbeat=None):
+        """Roll every recurring master forward to the current horizon, calling `heartbeat` after each batch."""
+        until = cls.horizon()
+        threshold = until - timedelta(days=1)
+        query = {
+            "isRecurring": True,
+            "$and": [{"$or": [{"occurrencesUntil": {"$exists": False}},
+                              {"occurrencesUntil": {"$lt": threshold},
+                               "$or": [{"recurrenceEnd": {"$exists": False}},
+                                       {"$expr": {"$gt": ["$recurrenceEnd", "$occurrencesUntil"]}}]}]}]
+        }
+        while True:
+            masters = list(Event.stream(query, limit=batch_size))
+            if not masters:
+                return
+            cls.materialize(masters, until=until, extend=True)
+            if heartbeat:
+                heartbeat()
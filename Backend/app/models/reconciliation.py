@@ -0,0 +1,111 @@
+from pymongo.operations import UpdateOne
+
+from app.models.sync_state import SyncState
+from app.models.meetsection import Meetsection
+from app.models.occurrence import EventOccurrence
+from app.models.event import Event, RecurringExceptionEvent
+
+
+# Fields of the stored events needed to match incoming ones
+INDEX_PROJECTION = {"id": 1, "providerId": 1, "user": 1, "meetsections": 1}
+
+
+class EventReconciler:
+    """Reconciles batches of provider events with the stored events of an account.
+
+    Stored documents are indexed by providerId and by (providerId, user) once per
+    batch, and the account's default meetsection is resolved once per reconciler,
+    so a sync costs a constant number of lookups per incoming event.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self.user = account.get_user_id()
+        self._default_meetsection = None
+        self._service = None
+
+    @property
+    def default_meetsection(self):
+        if self._default_meetsection is None:
+            self._default_meetsection = Meetsection.get_default(self.account.email).id
+        return self._default_meetsection
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = self.account.get_service()
+        return self._service
+
+    def reconcile_google(self, events):
+        def populate(event, ev):
+            event.from_google_event(ev)
+        return self.reconcile(events, "recurringEventId", populate)
+
+    def reconcile_microsoft(self, events):
+        def populate(event, ev):
+            if ev.get("@removed"):
+                event.providerId = ev["id"]
+                event.isDeleted = True
+            else:
+                event.from_microsoft_event(ev, self.service)
+        events = [ev for ev in events if ev.get("type") != "occurrence"]
+        return self.reconcile(events, "seriesMasterId", populate)
+
+    def reconcile(self, events, recurring_key, populate):
+        changed_meetsections = set()
+        if not events:
+            return changed_meetsections
+        by_provider_id, by_provider_id_user, member_meetsections = self.index(events)
+        REE = RecurringExceptionEvent
+        bulk_write_data = {Event._collection: [], REE._collection: []}
+        changed_series = set()
+        for ev in events:
+            _id = None
+            user_event_object = by_provider_id_user.get((ev["id"], self.user))
+            if user_event_object:
+                _id = user_event_object["id"]
+                meetsections = user_event_object["meetsections"]
+            else:
+                meetsections = [m for event_object in by_provider_id.get(ev["id"], [])
+                                for m in event_object["meetsections"] if m in member_meetsections]
+            if not meetsections:
+                meetsections = [self.default_meetsection]
+            meetsections = list(set(meetsections))
+            recurring_event_id = ev.get(recurring_key)
+            params = {"meetsections": meetsections, "user": self.user, "id": _id}
+            event = Event(**params) if not recurring_event_id else REE(**params)
+            event.recurringEventProviderId = recurring_event_id
+            populate(event, ev)
+            update = {"$set": event.json()}
+            if event.isRecurring and not event.recurrenceEnd:
+                update["$unset"] = {"recurrenceEnd": ""}
+            operation = UpdateOne({"providerId": event.providerId, "user": self.user}, update, upsert=True)
+            bulk_write_data[event._collection].append(operation)
+            changed_meetsections |= set(meetsections)
+            if recurring_event_id:
+                changed_series.add(recurring_event_id)
+            elif event.isRecurring or event.isDeleted or event.status == Event.Status.CANCELLED.value:
+                changed_series.add(event.providerId)
+        Event.bulk_write(bulk_write_data[Event._collection])
+        REE.bulk_write(bulk_write_data[REE._collection])
+        EventOccurrence.refresh(self.user, changed_series)
+        # Only once the occurrences are rebuilt, ranges computed in between are cached under the old version
+        SyncState(self.user).bump_version()
+        return changed_meetsections
+
+    def index(self, events):
+        query = {"providerId": {"$in": [ev["id"] for ev in events]}}
+        by_provider_id = dict()
+        by_provider_id_user = dict()
+        meetsection_ids = set()
+        for _ev in Event.find(query, projection=INDEX_PROJECTION, inactive=True) + \
+                RecurringExceptionEvent.find(query, projection=INDEX_PROJECTION, inactive=True):
+            by_provider_id.setdefault(_ev["providerId"], []).append(_ev)
+            by_provider_id_user[(_ev["providerId"], _ev["user"])] = _ev
+            meetsection_ids.update(_ev["meetsections"])
+        member_meetsections = set()
+        if meetsection_ids:
+            _meetsections = Meetsection.find({"id": {"$in": list(meetsection_ids)},
+                                              "members.email": self.account.email}, projection={"id": 1})
+            member_meetsections = set(m["id"] for m in _meetsections)
+        return by_provider_id, by_provider_id_user, member_meetsections
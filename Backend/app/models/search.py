@@ -0,0 +1,76 @@
+import json
+import heapq
+import base64
+
+from itertools import islice
+
+from app.utils.datetime import get_datetime
+from app.models.event import Event, EventSummary, RecurringExceptionEvent
+
+
+class EventSearch:
+    """Ranked text search over the events of a user and the exceptions of their series.
+
+    Both collections run the same pipeline, served by their (user, text, start) text
+    index: matches sorted by text score then id, projected to `EventSummary` fields.
+    The two result streams are merged by score into pages of `page_size`, and pages
+    are chained with an opaque cursor holding the (score, id) of the last result.
+    """
+    models = (Event, RecurringExceptionEvent)
+
+    def __init__(self, user, text, page_size, start=None, end=None, meetsection=None):
+        self.user = user
+        self.text = text
+        self.page_size = page_size
+        self.start = get_datetime(start)
+        self.end = get_datetime(end)
+        self.meetsection = meetsection
+
+    def get_query(self):
+        query = {"$text": {"$search": self.text}, "user": self.user}
+        if self.start or self.end:
+            query["start"] = dict()
+            if self.start:
+                query["start"]["$gte"] = self.start
+            if self.end:
+                query["start"]["$lt"] = self.end
+        if self.meetsection:
+            query["meetsections"] = self.meetsection
+        return query
+
+    def get_pipeline(self, model, after=None):
+        pipeline = [{"$match": model.get_query(self.get_query())},
+                    {"$project": {**EventSummary.projection, "_id": 0, "score": {"$meta": "textScore"}}}]
+        if after:
+            score, _id = after
+            pipeline.append({"$match": {"$or": [{"score": {"$lt": score}}, {"score": score, "id": {"$gt": _id}}]}})
+        # One extra result tells whether there is a next page
+        pipeline += [{"$sort": {"score": -1, "id": 1}}, {"$limit": self.page_size + 1}]
+        return pipeline
+
+    def page(self, cursor=None):
+        """The documents of the page after `cursor` (the first one without), and the cursor of the next page."""
+        after = self.decode_cursor(cursor) if cursor else None
+        results = heapq.merge(*(model.get_collection().aggregate(self.get_pipeline(model, after))
+                                for model in self.models),
+                              key=lambda document: (-document["score"], document["id"]))
+        documents = list(islice(results, self.page_size + 1))
+        if len(documents) <= self.page_size:
+            return documents, None
+        documents = documents[:self.page_size]
+        return documents, self.encode_cursor(documents[-1])
+
+    @staticmethod
+    def encode_cursor(document):
+        return base64.urlsafe_b64encode(json.dumps([document["score"], document["id"]]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """The (score, id) of a cursor, raises `ValueError` when it is not one of ours."""
+        try:
+            score, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor.")
+        if not (isinstance(score, (int, float)) and isinstance(_id, str)):
+            raise ValueError("Invalid cursor.")
+        return score, _id
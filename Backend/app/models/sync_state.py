@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import shortuuid
+
+from pymongo import IndexModel, ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.extensions import db
+
+
+class LeaseLost(Exception):
+    """The sync lease expired and was taken by another worker, the holder must stop."""
+
+
+class SyncState:
+    """Per user calendar sync lease, shared by every web and job worker.
+
+    Only the holder of the lease talks to the calendar providers for a user.
+    Anyone else asking for a sync in the meantime just marks the state dirty
+    and the holder runs one more round before letting go.
+
+    The state also holds the user's calendar `version`, bumped on every write to
+    their events, which keys the cached calendar ranges.
+    """
+    _collection = 'sync_states'
+    _indexes = [IndexModel([("user", ASCENDING)], unique=True)]
+    # The lease relies on the upsert of a second state failing
+    _required_indexes = _indexes
+
+    def __init__(self, user):
+        self.user = user
+        self._token = None
+
+    @classmethod
+    def get_collection(cls):
+        return db.get_conn()[cls._collection]
+
+    @property
+    def token(self):
+        return self._token
+
+    def acquire(self, lease_seconds, min_interval=0, dirty_only=False):
+        """Take the lease. Returns `None` when acquired, otherwise the current state document."""
+        utc_now = datetime.utcnow()
+        token = shortuuid.uuid()
+        conditions = [{"$or": [{"leaseExpiresAt": None}, {"leaseExpiresAt": {"$lt": utc_now}}]}]
+        if min_interval:
+            last_allowed = utc_now - timedelta(seconds=min_interval)
+            conditions.append({"$or": [{"lastSyncedAt": None}, {"lastSyncedAt": {"$lte": last_allowed}}]})
+        if dirty_only:
+            conditions.append({"dirty": True})
+        update = {"$set": {"leaseExpiresAt": utc_now + timedelta(seconds=lease_seconds),
+                           "leaseToken": token, "dirty": False, "updatedAt": utc_now}}
+        try:
+            self.get_collection().update_one({"user": self.user, "$and": conditions}, update,
+                                             upsert=not dirty_only)
+        except DuplicateKeyError:
+            pass
+        state = self.get_collection().find_one({"user": self.user})
+        if state and state.get("leaseToken") == token:
+            self._token = token
+            return
+        return state or dict()
+
+    def renew(self, lease_seconds):
+        """Extend the lease, returns whether it is still held."""
+        utc_now = datetime.utcnow()
+        update = {"$set": {"leaseExpiresAt": utc_now + timedelta(seconds=lease_seconds), "updatedAt": utc_now}}
+        result = self.get_collection().update_one({"user": self.user, "leaseToken": self._token}, update)
+        return bool(result.matched_count)
+
+    def keep(self, lease_seconds):
+        """Renew the lease, raises `LeaseLost` when another worker has taken it."""
+        if not self.renew(lease_seconds):
+            raise LeaseLost(f"Sync lease of user `{self.user}` lost")
+
+    def mark_dirty(self):
+        self.get_collection().update_one({"user": self.user},
+                                         {"$set": {"dirty": True, "updatedAt": datetime.utcnow()}},
+                                         upsert=True)
+
+    def get_version(self):
+        state = self.get_collection().find_one({"user": self.user}, {"version": 1})
+        return (state or dict()).get("version", 0)
+
+    def bump_version(self):
+        self.get_collection().update_one({"user": self.user},
+                                         {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+                                         upsert=True)
+
+    def take_dirty(self):
+        """Clear the dirty flag, returns whether it was set."""
+        result = self.get_collection().update_one({"user": self.user, "leaseToken": self._token, "dirty": True},
+                                                  {"$set": {"dirty": False}})
+        return bool(result.modified_count)
+
+    def release(self):
+        """Let go of the lease, returns whether the state got dirty in the meantime."""
+        utc_now = datetime.utcnow()
+        state = self.get_collection().find_one_and_update(
+            {"user": self.user, "leaseToken": self._token},
+            {"$set": {"lastSyncedAt": utc_now, "updatedAt": utc_now},
+             "$unset": {"leaseExpiresAt": "", "leaseToken": ""}},
+            return_document=ReturnDocument.AFTER)
+        self._token = None
+        return bool(state and state.get("dirty"))
@@ -1,15 +1,23 @@
-from app.extensions import login_manager
+import logging
+
+from datetime import datetime, timedelta
+
+from app import app
+from app.extensions import login_manager, job_queue
+from app.models.sync_state import SyncState, LeaseLost
 from app.models.base.user_base import UserBase
 from app.models.base.account import Account, Google, Microsoft
 
+logger = logging.getLogger(__name__)
+
 
 class User(UserBase):
     def get_account(self, account_type):
         acc = next(filter(lambda a: a["type"] == account_type, self.accounts), None)
         if account_type == Account.Type.GOOGLE.value:
-            account = Google(**acc)
+            account = Google.from_db(acc)
         elif account_type == Account.Type.MICROSOFT.value:
-            account = Microsoft(**acc)
+            account = Microsoft.from_db(acc)
         else:
             raise ValueError('Invalid account type')
         account._user = self
@@ -47,7 +55,14 @@ class User(UserBase):
         if save:
             self.save()
 
-    def sync_calendars(self, initial=False):
+    def sync_calendars(self, initial=False, dirty_only=False, heartbeat=None):
+        """Sync every connected calendar, at most one sync per user at a time.
+
+        A call made while another sync holds the lease, or within `SYNC_MIN_INTERVAL`
+        of the last one, only marks the user dirty; the dirty state is picked up by the
+        running sync or by a deferred `sync_calendars` job. `heartbeat`, the job lease
+        renewal of a sync run by the worker, is called with every renewal of the sync lease.
+        """
         if initial:
             from app.models.meetsection import Meetsection
             primary_account = self.get_primary_account()
@@ -59,12 +74,48 @@ class User(UserBase):
             }
             meetsection = Meetsection(**meetsection_object)
             meetsection.save()
-        for acc in self.accounts:
-            account = self.get_account(acc["type"])
-            calendar = account.get_calendar()
-            calendar.sync_events()
-            # if initial:
-            #     calendar.watch()
+        lease_seconds = app.config.get('SYNC_LEASE_SECONDS')
+        min_interval = app.config.get('SYNC_MIN_INTERVAL') if not (initial or dirty_only) else 0
+        sync_state = SyncState(self.id)
+        state = sync_state.acquire(lease_seconds, min_interval=min_interval, dirty_only=dirty_only)
+        if state is not None:
+            if dirty_only:
+                return False
+            sync_state.mark_dirty()
+            lease_expires_at = state.get("leaseExpiresAt")
+            if not (lease_expires_at and lease_expires_at > datetime.utcnow()):
+                last_synced_at = state.get("lastSyncedAt")
+                run_at = last_synced_at + timedelta(seconds=min_interval) if last_synced_at else None
+                job_queue.enqueue("sync_calendars", run_at=run_at, key=f"sync_calendars:{self.id}",
+                                  user_id=self.id, dirty_only=True)
+            return False
+
+        def keep_lease():
+            sync_state.keep(lease_seconds)
+            if heartbeat:
+                heartbeat()
+
+        try:
+            while True:
+                for acc in self.accounts:
+                    account = self.get_account(acc["type"])
+                    calendar = account.get_calendar()
+                    calendar.sync_events(keep_lease=keep_lease)
+                    # if initial:
+                    #     calendar.watch()
+                if not sync_state.take_dirty():
+                    break
+                keep_lease()
+        except LeaseLost as e:
+            # The new holder resumes from the last checkpointed page
+            logger.warning(str(e))
+            return False
+        finally:
+            dirty = sync_state.release()
+        if dirty:
+            job_queue.enqueue("sync_calendars", key=f"sync_calendars:{self.id}",
+                              user_id=self.id, dirty_only=True)
+        return True
 
     # Flask login - Properties
 
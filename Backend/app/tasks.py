@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from app.extensions import job_queue
+from app.models.user import User
+from app.models.occurrence import EventOccurrence
+
+
+@job_queue.task('sync_calendars', heartbeat=True)
+def sync_calendars(user_id, dirty_only=False, heartbeat=None):
+    user = User.find_one({"id": user_id})
+    if not user:
+        return
+    user.sync_calendars(dirty_only=dirty_only, heartbeat=heartbeat)
+
+
+@job_queue.task('materialize_occurrences')
+def materialize_occurrences(user_id):
+    EventOccurrence.materialize_stale(user_id)
+
+
+@job_queue.task('extend_occurrence_horizon', heartbeat=True)
+def extend_occurrence_horizon(heartbeat=None):
+    try:
+        EventOccurrence.extend_horizon(heartbeat=heartbeat)
+    finally:
+        schedule_occurrence_horizon(run_at=datetime.utcnow() + timedelta(days=1))
+
+
+def schedule_occurrence_horizon(run_at=None):
+    job_queue.enqueue('extend_occurrence_horizon', run_at=run_at, key='extend_occurrence_horizon')
@@ -1,5 +1,8 @@
+import re
 import pytz
+import numpy as np
 
+from functools import lru_cache
 from dateutil import parser, rrule
 from datetime import datetime, timedelta
 
@@ -7,6 +10,21 @@ weekday_map = {"monday": 0, "tuesday": 1, "wednesday": 2,
                "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
 position_map = {"first": 1, "second": 2, "third": 3, "fourth": 4, "last": -1}
 
+weekday_codes = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+RRULESET_CACHE_SIZE = 1024
+ISO_FRACTION_RE = re.compile(r'(\.\d{6})\d+')
+SEEKABLE_FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+SEEKABLE_RULE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "WKST"}
+VECTORIZABLE_FREQUENCIES = ("DAILY", "WEEKLY")
+
+DAY_US = 24 * 3600 * 10 ** 6
+RECURRENCE_END_LIMIT = datetime(9999, 12, 31)
+
+
+# Strings parsed by `parse_datetime`, and how many of them needed dateutil's parser
+datetime_parse_stats = {"parsed": 0, "fallbacks": 0}
+
 
 def get_datetime(value):
     if isinstance(value, datetime):
@@ -17,15 +35,66 @@ def get_datetime(value):
         tz = None
         if isinstance(value, (tuple, list)):
             value, tz = value
-        value = parser.parse(value)
+        value = parse_datetime(value)
         if tz and value.tzinfo is None:
-            tz = pytz.timezone(tz)
+            tz = get_timezone(tz)
             value = tz.localize(value)
         if value.tzinfo is None:
             value = pytz.utc.localize(value)
     return value
 
 
+def get_datetime64(value):
+    """A datetime or string as a naive UTC `datetime64[us]`."""
+    return np.datetime64(get_datetime(value).astimezone(pytz.utc).replace(tzinfo=None), 'us')
+
+
+def parse_datetime(value):
+    """Parse an ISO-8601 string with `datetime.fromisoformat`, other formats with dateutil."""
+    datetime_parse_stats["parsed"] += 1
+    iso_value = value
+    if iso_value.endswith('Z'):
+        iso_value = iso_value[:-1] + '+00:00'
+    if '.' in iso_value:
+        # Microsoft sends 7 fractional digits, fromisoformat takes at most 6
+        iso_value = ISO_FRACTION_RE.sub(r'\1', iso_value)
+    try:
+        return datetime.fromisoformat(iso_value)
+    except ValueError:
+        datetime_parse_stats["fallbacks"] += 1
+        return parser.parse(value)
+
+
+def get_datetime_parse_stats():
+    """Parse counts of `parse_datetime` with the share of strings that fell back to dateutil."""
+    parsed, fallbacks = datetime_parse_stats["parsed"], datetime_parse_stats["fallbacks"]
+    return {"parsed": parsed, "fallbacks": fallbacks, "fallbackRate": fallbacks / parsed if parsed else 0.0}
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    return pytz.timezone(name)
+
+
+def get_utc_offsets(instants, timezone):
+    """UTC offsets of a pytz timezone at each instant of a naive UTC `datetime64` array."""
+    transitions, offsets = _get_utc_transitions(timezone.zone)
+    if transitions is None:
+        return np.full(len(instants), offsets, dtype='timedelta64[us]')
+    return offsets[np.searchsorted(transitions, instants, side='right') - 1]
+
+
+@lru_cache(maxsize=None)
+def _get_utc_transitions(name):
+    timezone = get_timezone(name)
+    utc_transition_times = getattr(timezone, '_utc_transition_times', None)
+    if not utc_transition_times:
+        return None, np.timedelta64(timezone.utcoffset(datetime.utcnow()), 'us')
+    # Same lookup as pytz's `fromutc`, the offset of the last transition at or before the instant
+    return (np.array(utc_transition_times, dtype='datetime64[us]'),
+            np.array([info[0] for info in timezone._transition_info], dtype='timedelta64[us]'))
+
+
 def get_rrule_from_pattern(rp):
     if not rp:
         return
@@ -33,11 +102,11 @@ def get_rrule_from_pattern(rp):
     r = rp["range"]
     end = None
     count = None
-    start = parser.parse(r["startDate"])
+    start = parse_datetime(r["startDate"])
     if r["type"] == "numbered":
         count = r["numberOfOccurrences"]
     elif r["type"] == "endDate":
-        end = parser.parse(r["endDate"])
+        end = parse_datetime(r["endDate"])
     elif r["type"] == "noEnd":
         pass
     else:
@@ -77,9 +146,20 @@ def get_rrule_from_pattern(rp):
 
 
 def get_rruleset(recurrence, start):
-    _recurrence = []
     if start.tzinfo:
         start = start.astimezone(pytz.utc).replace(tzinfo=None)
+    return _compile_rruleset(tuple(recurrence), start)
+
+
+def get_rruleset_cache_info():
+    """Hits, misses and size of the compiled rruleset cache."""
+    return _compile_rruleset.cache_info()
+
+
+@lru_cache(maxsize=RRULESET_CACHE_SIZE)
+def _compile_rruleset(recurrence, start):
+    # Compiled rulesets are shared between callers, they must only be read from.
+    _recurrence = []
     for rule in recurrence:
         if rule.startswith('RRULE') and 'UNTIL' in rule:
             _recurrence.append(rule.replace('Z', ''))
@@ -90,10 +170,183 @@ def get_rruleset(recurrence, start):
     return rrule.rrulestr('\n'.join(_recurrence), dtstart=start)
 
 
-def get_start_times(recurrence, start, end=None):
+def get_start_times(recurrence, start, end=None, window_start=None):
+    """Start times of a series between `window_start` (defaults to the series start) and `end`."""
+    start, end, window_start = _get_window(start, end, window_start)
+    start_times = expand_simple_recurrence(recurrence, start, end, window_start)
+    if start_times is not None:
+        return start_times.tolist()
+    return _get_rruleset_start_times(recurrence, start, end, window_start)
+
+
+def get_recurrence_end(recurrence, start):
+    """Start of the last occurrence of a series, `None` when the series has no end."""
+    rules = [rule for rule in recurrence if rule.startswith('RRULE')]
+    if not rules or any(("COUNT" not in rule) and ("UNTIL" not in rule) for rule in rules):
+        return
+    start_times = get_start_times(recurrence, start, RECURRENCE_END_LIMIT)
+    return start_times[-1] if start_times else None
+
+
+def get_start_times_array(recurrence, start, end=None, window_start=None):
+    """Same as `get_start_times`, as a `datetime64[us]` array of naive UTC instants."""
+    start, end, window_start = _get_window(start, end, window_start)
+    start_times = expand_simple_recurrence(recurrence, start, end, window_start)
+    if start_times is None:
+        start_times = np.array(_get_rruleset_start_times(recurrence, start, end, window_start),
+                               dtype='datetime64[us]')
+    return start_times
+
+
+def _get_window(start, end, window_start):
     if end is None:
         end = datetime.utcnow() + timedelta(days=90)
     else:
         end = get_datetime(end).astimezone(pytz.utc).replace(tzinfo=None)
     start = get_datetime(start).astimezone(pytz.utc).replace(tzinfo=None)
-    return get_rruleset(recurrence, start).between(start, end, inc=True)
+    if window_start is None:
+        window_start = start
+    else:
+        window_start = get_datetime(window_start).astimezone(pytz.utc).replace(tzinfo=None)
+    return start, end, window_start
+
+
+def _get_rruleset_start_times(recurrence, start, end, window_start):
+    dtstart = start
+    if window_start > start:
+        seeked = seek_recurrence(recurrence, start, window_start)
+        if seeked:
+            recurrence, dtstart = seeked
+    return get_rruleset(recurrence, dtstart).between(window_start, end, inc=True)
+
+
+def expand_simple_recurrence(recurrence, start, end, window_start):
+    """Start times of a plain DAILY or WEEKLY series, computed with datetime64 arithmetic.
+
+    Handles a single RRULE made of FREQ, INTERVAL, COUNT, UNTIL, BYDAY and WKST (BYDAY
+    on a DAILY rule only with an INTERVAL of 1). Arguments are naive UTC datetimes.
+    Returns a `datetime64[us]` array, or `None` for anything else (RDATE, EXDATE,
+    other frequencies or rule parts), which dateutil expands instead.
+    """
+    if len(recurrence) != 1 or not recurrence[0].startswith('RRULE'):
+        return
+    parts = parse_rrule(recurrence[0])
+    frequency = parts.get("FREQ")
+    if frequency not in VECTORIZABLE_FREQUENCIES or set(parts) - SEEKABLE_RULE_PARTS:
+        return
+    interval = int(parts.get("INTERVAL", 1))
+    wkst = weekday_codes.get(parts.get("WKST", "MO"))
+    if interval < 1 or wkst is None:
+        return
+    if "BYDAY" in parts:
+        weekdays = [weekday_codes.get(day) for day in parts["BYDAY"].split(',')]
+        if None in weekdays or (frequency == "DAILY" and interval != 1):
+            return
+        # Every day filtered by weekday is every week on those weekdays
+        frequency = "WEEKLY"
+    else:
+        weekdays = [start.weekday()]
+
+    start = start.replace(microsecond=0)
+    if frequency == "DAILY":
+        anchor = start
+        period = interval * DAY_US
+        offsets = np.zeros(1, dtype=np.int64)
+        skipped = 0
+    else:
+        start_offset = (start.weekday() - wkst) % 7
+        anchor = start - timedelta(days=start_offset)
+        period = 7 * interval * DAY_US
+        offsets = np.array(sorted(set((day - wkst) % 7 for day in weekdays)), dtype=np.int64)
+        # Days of the first week before the series start are not occurrences
+        skipped = int((offsets < start_offset).sum())
+
+    if "UNTIL" in parts:
+        end = min(end, parser.parse(parts["UNTIL"].replace('Z', '')))
+    anchor, start, end, window_start = (np.datetime64(dt, 'us').astype(np.int64)
+                                        for dt in (anchor, start, end, window_start))
+    first_period = max(0, (window_start - anchor) // period)
+    last_period = (end - anchor) // period
+    if "COUNT" in parts:
+        last_period = min(last_period, (int(parts["COUNT"]) - 1 + skipped) // len(offsets))
+    if last_period < first_period:
+        return np.array([], dtype='datetime64[us]')
+
+    periods = np.arange(first_period, last_period + 1, dtype=np.int64)[:, None]
+    start_times = anchor + periods * period + offsets * DAY_US
+    mask = (start_times >= max(start, window_start)) & (start_times <= end)
+    if "COUNT" in parts:
+        index = periods * len(offsets) + np.arange(len(offsets)) - skipped
+        mask &= index < int(parts["COUNT"])
+    return start_times[mask].astype('datetime64[us]')
+
+
+def parse_rrule(rule):
+    """Split an `RRULE:` line into its parts, `{"FREQ": "WEEKLY", "BYDAY": "MO,WE", ...}`."""
+    rule = rule.split(':', 1)[1] if ':' in rule else rule
+    return dict(part.split('=', 1) for part in rule.split(';') if part)
+
+
+def _add_months(dt, months):
+    month = dt.month - 1 + months
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1)
+
+
+def seek_recurrence(recurrence, start, window_start):
+    """Move the DTSTART of a fixed interval series forward to the period containing `window_start`.
+
+    Returns `(recurrence, dtstart)` generating the same occurrences as the original
+    series from `window_start` on, with COUNT reduced by the occurrences skipped.
+    Returns `None` when the series is not simple enough to seek, or nothing is skipped;
+    dateutil then walks the series from its start.
+    """
+    rules = [rule for rule in recurrence if rule.startswith('RRULE')]
+    if len(rules) != 1 or any(rule.startswith('EXRULE') for rule in recurrence):
+        return
+    parts = parse_rrule(rules[0])
+    if parts.get("FREQ") not in SEEKABLE_FREQUENCIES or set(parts) - SEEKABLE_RULE_PARTS:
+        return
+    interval = int(parts.get("INTERVAL", 1))
+    frequency = parts["FREQ"]
+
+    if frequency == "DAILY":
+        if "BYDAY" in parts:
+            return
+        periods = (window_start - start) // timedelta(days=interval)
+        dtstart = start + timedelta(days=periods * interval)
+        skipped = periods
+    elif frequency == "WEEKLY" and "BYDAY" in parts:
+        wkst = weekday_codes.get(parts.get("WKST", "MO"))
+        weekdays = [weekday_codes.get(day) for day in parts["BYDAY"].split(',')]
+        if wkst is None or None in weekdays:
+            return
+        offsets = set((day - wkst) % 7 for day in weekdays)
+        start_offset = (start.weekday() - wkst) % 7
+        week_start = start - timedelta(days=start_offset)
+        periods = (window_start - week_start) // timedelta(weeks=interval)
+        # Seek to the first day of the week, the earlier BYDAY days of that week are still due
+        dtstart = week_start + timedelta(weeks=periods * interval)
+        skipped = len([o for o in offsets if o >= start_offset]) + (periods - 1) * len(offsets)
+    elif frequency == "WEEKLY":
+        periods = (window_start - start) // timedelta(weeks=interval)
+        dtstart = start + timedelta(weeks=periods * interval)
+        skipped = periods
+    else:
+        if "BYDAY" in parts or start.day > 28:
+            return
+        months = (window_start.year - start.year) * 12 + window_start.month - start.month
+        if _add_months(start, months) > window_start:
+            months -= 1
+        periods = months // interval
+        dtstart = _add_months(start, periods * interval)
+        skipped = periods
+
+    if periods <= 0:
+        return
+    rule = rules[0]
+    if "COUNT" in parts:
+        count = int(parts["COUNT"]) - skipped
+        if count <= 0:
+            return
+        rule = rule.replace(f"COUNT={parts['COUNT']}", f"COUNT={count}")
+    return [rule if r == rules[0] else r for r in recurrence], dtstart
@@ -1,5 +1,9 @@
 import re
+import pytz
 import datetime
+import functools
+import contextlib
+import contextvars
 
 
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
@@ -28,22 +32,52 @@ URL_REGEX = re.compile(
 EMAIL_REGEX = re.compile('^[a-z0-9]+[._]?[a-z0-9]+[@]\w+[.]\w+$')
 PHONE_REGEX = re.compile("^[+]*[(]?[0-9]{1,4}[)]?[-\s./0-9]*$")
 
+# Set while hydrating stored documents, their values were validated before being stored
+_trusted = contextvars.ContextVar('trusted', default=False)
 
+
+@contextlib.contextmanager
+def trusted():
+    """Skip the checks of this module in the block."""
+    token = _trusted.set(True)
+    try:
+        yield
+    finally:
+        _trusted.reset(token)
+
+
+def is_trusted():
+    return _trusted.get()
+
+
+def skip_when_trusted(check):
+    @functools.wraps(check)
+    def wrapper(*args, **kwargs):
+        if _trusted.get():
+            return
+        return check(*args, **kwargs)
+    return wrapper
+
+
+@skip_when_trusted
 def check_min_length(field, value, length):
     if len(value) < length:
         raise ValueError(f"{field.title()} field should be at least {length} character(s) long.")
 
 
+@skip_when_trusted
 def check_max_length(field, value, length):
     if len(value) > length:
         raise ValueError(f"{field.title()} field should be at least {length} character(s) long.")
 
 
+@skip_when_trusted
 def check_instance_type(field, value, typ):
     if value and not isinstance(value, typ):
         raise ValueError(f"{field.title()} field should be of {typ}, not {type(value)}.")
 
 
+@skip_when_trusted
 def check_regex_match(field, value, regex):
     if value:
         if isinstance(regex, str):
@@ -54,6 +88,7 @@ def check_regex_match(field, value, regex):
                 raise ValueError(f"Invalid {field.title()}")
 
 
+@skip_when_trusted
 def check_date(field, value):
     check_instance_type(field, value, str)
 
@@ -66,6 +101,15 @@ def check_date(field, value):
         raise ValueError(f"{field.title()} should be of format '{DATE_FORMAT}'.")
 
 
+@skip_when_trusted
 def check_choices(field, value, allowed_values):
     if value.upper() not in allowed_values:
         raise AttributeError(f"{field.title()} must be one of {repr(allowed_values)}")
+
+
+@skip_when_trusted
+def check_timezone(field, value):
+    try:
+        pytz.timezone(value)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"Invalid {field.title()}")
@@ -26,6 +26,30 @@ class Config:
     FIREBASE_CREDS_PATH = getenv('FIREBASE_CREDS_PATH')
     FIREBASE_OPTS_PATH = getenv('FIREBASE_OPTS_PATH')
 
+    JOB_LEASE_SECONDS = int(getenv('JOB_LEASE_SECONDS', 300))
+    JOB_MAX_ATTEMPTS = int(getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_BASE = int(getenv('JOB_BACKOFF_BASE', 10))
+    JOB_BACKOFF_MAX = int(getenv('JOB_BACKOFF_MAX', 3600))
+    JOB_POLL_INTERVAL = float(getenv('JOB_POLL_INTERVAL', 2))
+
+    SYNC_LEASE_SECONDS = int(getenv('SYNC_LEASE_SECONDS', 600))
+    SYNC_MIN_INTERVAL = int(getenv('SYNC_MIN_INTERVAL', 60))
+
+    OCCURRENCE_HORIZON_DAYS = int(getenv('OCCURRENCE_HORIZON_DAYS', 180))
+    OCCURRENCE_RETENTION_DAYS = int(getenv('OCCURRENCE_RETENTION_DAYS', 90))
+
+    FREE_SLOT_GRANULARITY_MINUTES = int(getenv('FREE_SLOT_GRANULARITY_MINUTES', 15))
+    FREE_SLOT_MAX_DAYS = int(getenv('FREE_SLOT_MAX_DAYS', 62))
+    FREE_SLOT_MAX_COUNT = int(getenv('FREE_SLOT_MAX_COUNT', 50))
+
+    CONFLICT_MAX_SLOTS = int(getenv('CONFLICT_MAX_SLOTS', 500))
+    CONFLICT_MAX_DAYS = int(getenv('CONFLICT_MAX_DAYS', 62))
+
+    RANGE_CACHE_SIZE = int(getenv('RANGE_CACHE_SIZE', 256))
+
+    SEARCH_PAGE_SIZE = int(getenv('SEARCH_PAGE_SIZE', 20))
+    SEARCH_MAX_PAGE_SIZE = int(getenv('SEARCH_MAX_PAGE_SIZE', 100))
+
 
 class LocalConfig(Config):
     APP_URL = getenv('APP_URL')
@@ -0,0 +1,21 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+os.environ.setdefault('PERMANENT_SESSION_LIFETIME', '3600')
+
+from app import app as flask_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """An in memory database behind `db.get_conn()`, in an app context."""
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(db, 'mongo', SimpleNamespace(cx=client))
+    monkeypatch.setattr(db, 'database', 'test')
+    with flask_app.app_context():
+        yield client['test']
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import pytz
+
+from app import app as flask_app
+from app.api import meetsection as meetsection_api
+from app.models.event import Event
+from app.models.availability import BusyIntervals, BusyBitmap
+
+DAY = datetime(2030, 1, 7, tzinfo=pytz.utc)
+
+
+def save_events(user):
+    # A plain meeting from 09:00 to 10:00, and a daily standup from 09:00 to 09:15
+    Event(user=user, title="Review", providerId="review", start=DAY + timedelta(hours=9),
+          end=DAY + timedelta(hours=10)).save()
+    Event(user=user, title="Standup", providerId="standup", isRecurring=True, recurrence=["RRULE:FREQ=DAILY"],
+          start=DAY - timedelta(days=7) + timedelta(hours=9),
+          end=DAY - timedelta(days=7) + timedelta(hours=9, minutes=15)).save()
+
+
+def test_saved_plain_event_is_stored_as_not_recurring(database):
+    save_events("USR")
+    assert database['events'].find_one({"providerId": "review"})["isRecurring"] is False
+
+
+def test_conflicts_count_plain_and_recurring_events(database):
+    save_events("USR")
+    slots = [(DAY + timedelta(hours=9), DAY + timedelta(hours=9, minutes=30)),
+             (DAY + timedelta(hours=9, minutes=30), DAY + timedelta(hours=11)),
+             (DAY + timedelta(hours=11), DAY + timedelta(hours=12))]
+    assert BusyIntervals.count_conflicts("USR", slots) == [2, 1, 0]
+
+
+def test_conflicts_count_events_stored_without_is_recurring(database):
+    database['events'].insert_one({"id": "EVTLEGACY", "user": "USR", "providerId": "legacy",
+                                   "start": datetime(2030, 1, 7, 14), "end": datetime(2030, 1, 7, 15)})
+    assert BusyIntervals.count_conflicts("USR", [(DAY + timedelta(hours=14), DAY + timedelta(hours=16))]) == [1]
+
+
+def test_free_slots_skip_plain_events(database, monkeypatch):
+    database['users'].insert_one({"id": "USR", "accounts": [{"email": "a@b.c"}], "timeZone": "UTC"})
+    database['meetsections'].insert_one({"id": "SEC", "name": "Team", "members": [{"email": "a@b.c"}]})
+    save_events("USR")
+    monkeypatch.setattr(meetsection_api, 'current_user', SimpleNamespace(id="USR", timeZone="UTC",
+                                                                          get_primary_email=lambda: "a@b.c"))
+    query = {"start": "2030-01-07T09:00:00Z", "end": "2030-01-07T12:00:00Z", "duration": 30, "count": 3}
+    with flask_app.test_request_context(query_string=query):
+        response, status = meetsection_api.find_free_slots("SEC")
+    assert status == 200
+    assert [slot["start"] for slot in response.get_json()] == ["2030-01-07T10:00:00Z", "2030-01-07T10:30:00Z",
+                                                               "2030-01-07T11:00:00Z"]
+
+
+def test_busy_bitmap_rows_follow_users(database):
+    save_events("USR")
+    bitmap = BusyBitmap.for_users(["FREE", "USR"], DAY + timedelta(hours=9), DAY + timedelta(hours=10),
+                                  timedelta(minutes=15))
+    assert bitmap.rows.tolist() == [[False] * 4, [True] * 4]
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import app as flask_app
+from app.api import event as event_api
+
+
+@pytest.fixture
+def post_slots(database, monkeypatch):
+    monkeypatch.setattr(event_api, 'current_user', SimpleNamespace(id="USR"))
+
+    def post(body):
+        with flask_app.test_request_context(method='POST', json=body):
+            response = event_api.batch_conflicts()
+        return response[1], response[0]
+    return post
+
+
+@pytest.mark.parametrize("body", [
+    {"slots": "2030-01-07T09:00:00Z"},
+    {"slots": ["2030-01-07T09:00:00Z"]},
+    {"slots": [{"start": 1, "end": 2}]},
+    {"slots": [{"start": "2030-01-07T10:00:00Z", "end": "2030-01-07T09:00:00Z"}]},
+    {"slots": [{"start": "2030-01-07T09:00:00Z", "end": "2030-01-07T10:00:00Z"},
+               {"start": "2031-01-07T09:00:00Z", "end": "2031-01-07T10:00:00Z"}]},
+    ["2030-01-07T09:00:00Z"],
+])
+def test_batch_conflicts_rejects_bad_slots(post_slots, body):
+    status, _ = post_slots(body)
+    assert status == 400
+
+
+def test_batch_conflicts_caps_the_slot_count(post_slots):
+    slot = {"start": "2030-01-07T09:00:00Z", "end": "2030-01-07T10:00:00Z"}
+    status, _ = post_slots({"slots": [slot] * (flask_app.config['CONFLICT_MAX_SLOTS'] + 1)})
+    assert status == 400
+
+
+def test_batch_conflicts_counts(post_slots):
+    status, body = post_slots({"slots": [{"start": "2030-01-07T09:00:00Z", "end": "2030-01-07T10:00:00Z"}]})
+    assert (status, body) == (200, {"counts": [0]})
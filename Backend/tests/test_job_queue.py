@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.extensions.job_queue import JobQueue
+
+
+@pytest.fixture
+def job_queue(database):
+    return JobQueue(db)
+
+
+def test_heartbeat_keeps_a_long_job_from_being_claimed_again(job_queue):
+    claims = []
+
+    @job_queue.task('sync', heartbeat=True)
+    def sync(heartbeat):
+        job_queue.get_collection().update_one({}, {"$set": {"leaseExpiresAt": datetime.utcnow() - timedelta(1)}})
+        heartbeat()
+        claims.append(job_queue.claim("other"))
+
+    job_queue.enqueue('sync')
+    job_queue.run_job(job_queue.claim("worker"))
+    assert claims == [None]
+    assert job_queue.get_collection().find_one()["status"] == JobQueue.DONE
+
+
+def test_heartbeat_stops_a_job_claimed_by_another_worker(job_queue):
+    pages = []
+
+    @job_queue.task('sync', heartbeat=True)
+    def sync(heartbeat):
+        job_queue.get_collection().update_one({}, {"$set": {"leaseExpiresAt": datetime.utcnow() - timedelta(1)}})
+        job_queue.claim("other")
+        heartbeat()
+        pages.append(1)
+
+    job_queue.enqueue('sync')
+    job_queue.run_job(job_queue.claim("worker"))
+    job = job_queue.get_collection().find_one()
+    assert pages == []
+    assert (job["status"], job["worker"]) == (JobQueue.RUNNING, "other")
+
+
+def test_tasks_without_heartbeat_get_their_kwargs_only(job_queue):
+    calls = []
+    job_queue.task('plain')(lambda **kwargs: calls.append(kwargs))
+    job_queue.enqueue('plain', user_id="USR")
+    job_queue.run_job(job_queue.claim("worker"))
+    assert calls == [{"user_id": "USR"}]
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from app.models.event import Event
+from app.models.occurrence import EventOccurrence
+
+START = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0, tzinfo=pytz.utc) - timedelta(days=3)
+
+
+def save_series(**kwargs):
+    Event(user="USR", title="Standup", providerId="standup", isRecurring=True, recurrence=["RRULE:FREQ=DAILY"],
+          start=START, end=START + timedelta(minutes=15), **kwargs).save()
+
+
+def get_occurrence_ids(database):
+    return [o["id"] for o in database['event_occurrences'].find({"event": "EVTSERIES"})]
+
+
+def test_repeated_rebuilds_write_each_occurrence_once(database):
+    database['event_occurrences'].create_indexes(EventOccurrence._indexes)
+    save_series(id="EVTSERIES")
+    ids = get_occurrence_ids(database)
+    masters = Event.find({"id": "EVTSERIES"})
+    EventOccurrence.materialize(masters)
+    # A horizon extension reading `occurrencesUntil` before a rebuild moved it
+    EventOccurrence.materialize([{**masters[0], "occurrencesUntil": START + timedelta(days=5)}], extend=True)
+    assert sorted(get_occurrence_ids(database)) == sorted(ids)
+    assert len(ids) == len(set(ids))
+
+
+def test_rebuild_deletes_the_occurrences_no_longer_produced(database):
+    save_series(id="EVTSERIES")
+    event = Event.from_db(Event.find({"id": "EVTSERIES"})[0])
+    event.recurrence = ["RRULE:FREQ=DAILY;COUNT=3"]
+    event.save()
+    assert len(get_occurrence_ids(database)) == 3
+
+
+def test_remove_duplicates_keeps_one_occurrence_per_id(database):
+    database['event_occurrences'].insert_many([{"id": "EVT__1", "event": "EVT"}, {"id": "EVT__1", "event": "EVT"},
+                                              {"id": "EVT__2", "event": "EVT"}])
+    assert EventOccurrence.remove_duplicates() == 1
+    assert sorted(o["id"] for o in database['event_occurrences'].find()) == ["EVT__1", "EVT__2"]
@@ -0,0 +1,8 @@
+from app import create_app
+
+if __name__ == '__main__':
+    app = create_app()
+    from app import tasks  # Registers task handlers with the job queue
+    with app.app_context():
+        tasks.schedule_occurrence_horizon()
+        app.job_queue.work()